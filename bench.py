@@ -0,0 +1,68 @@
+"""Micro-benchmarks for the detection hot path.
+
+Run with: python bench.py
+"""
+import re
+import time
+from main import utils
+
+def legacy_detect_language(text: str) -> str:
+    # The pre-compiled-detector implementation: one re.findall per pattern over the whole text
+    scores = {}
+    for lang, patterns in utils.language_patterns.items():
+        scores[lang] = sum(len(re.findall(p, text, re.IGNORECASE)) for p in patterns)
+    best_lang = max(scores, key=scores.get) if scores and max(scores.values()) > 0 else "unknown"
+    if best_lang != "unknown":
+        return f"{utils.LANG_EMOJIS.get(best_lang, '🔍')} {best_lang}"
+    return "❓ unknown"
+
+def legacy_detect_domain(text: str) -> str:
+    # The pre-index implementation: one lower() + substring search per keyword
+    domain_scores = {}
+    for domain, info in utils.domain_index.taxonomy.items():
+        score = sum(1 for keyword in info["keywords"] if keyword.lower() in text.lower())
+        if score > 0:
+            domain_scores[domain] = score
+    if domain_scores:
+        best_domain = max(domain_scores, key=domain_scores.get)
+        return f"{utils.domain_index.emojis.get(best_domain, '🎯')} {best_domain.replace('_', ' ').title()}"
+    return "🌐 general"
+
+def build_input(size: int = 100_000) -> str:
+    sample = (
+        "Assalam alaikum dost, kia haal hai? Main theek hoon, aaj Karachi mein barish hai aur kaam bahut zyada hai. "
+        "def handler(request):\n    import json\n    print(json.dumps(request))\n"
+        "The quarterly report covers machine learning adoption, cloud cost and startup funding trends. "
+    )
+    return (sample * (size // len(sample) + 1))[:size]
+
+def timeit(fn, text: str, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_language_detection():
+    text = build_input()
+    assert legacy_detect_language(text) == utils.detect_language_auto(text)
+    assert utils.language_detector.scores(text) == {
+        lang: sum(len(re.findall(p, text, re.IGNORECASE)) for p in patterns)
+        for lang, patterns in utils.language_patterns.items()
+    }
+    legacy = timeit(legacy_detect_language, text)
+    compiled = timeit(utils.detect_language_auto, text)
+    print(f"detect_language_auto (100 KB): legacy {legacy * 1000:.1f} ms, compiled {compiled * 1000:.1f} ms, "
+          f"speedup x{legacy / compiled:.1f}")
+
+def bench_domain_detection():
+    text = build_input()
+    legacy = timeit(legacy_detect_domain, text)
+    indexed = timeit(utils.detect_domain_auto, text)
+    print(f"detect_domain_auto (100 KB): legacy {legacy * 1000:.1f} ms, indexed {indexed * 1000:.1f} ms, "
+          f"speedup x{legacy / indexed:.1f} ({legacy_detect_domain(text)} -> {utils.detect_domain_auto(text)})")
+
+if __name__ == "__main__":
+    bench_language_detection()
+    bench_domain_detection()
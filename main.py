@@ -1,33 +1,162 @@
 import os
-import uvicorn
+import sys
+import argparse
 import json
 import re
 import asyncio
 import zipfile
-import PyPDF2
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
 from pathlib import Path
 from contextlib import asynccontextmanager
-from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, Request, Depends, File, UploadFile, Form
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterator
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, File, UploadFile, Form
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import httpx
 import logging
 from dotenv import load_dotenv
 import sqlite3
 import uuid
-import platform
-import psutil
-from docx import Document
 import csv
+import hashlib
+import gzip
+import time
+import threading
+import queue
+import base64
+import bisect
+import string
+import random
+from contextvars import ContextVar
+import io
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, Counter, deque
 # ====================== CONFIG 🚀 ======================
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 PORT = int(os.getenv("PORT", "8000"))
+DATA_DIR = Path(__file__).resolve().parent / "data"
+UI_ASSETS_ON_STARTUP = os.getenv("UI_ASSETS_ON_STARTUP", "sync")  # sync (hash-checked rebuild in create_app) | off (prebuilt)
+ASSET_GZIP_LEVEL = int(os.getenv("ASSET_GZIP_LEVEL", "9"))
+ASSET_BROTLI = os.getenv("ASSET_BROTLI", "auto")  # auto (when the brotli package is installed) | off
+ASSET_MAX_AGE = int(os.getenv("ASSET_MAX_AGE", "31536000"))  # fingerprinted URLs never change content
+DOMAIN_TAXONOMY_PATH = os.getenv("DOMAIN_TAXONOMY_PATH", str(DATA_DIR / "domains.json"))
+PROMPTS_PATH = os.getenv("PROMPTS_PATH", str(DATA_DIR / "prompts.json"))
+DEMO_RESPONSES_PATH = os.getenv("DEMO_RESPONSES_PATH", str(DATA_DIR / "demo_responses.json"))
 HOST = os.getenv("HOST", "0.0.0.0")
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+# 🔌 Shared HTTP pool - keep-alive + HTTP/2 towards Groq (and the web scraper)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+# 🧊 Completion cache - identical (feature, model, prompt) requests skip the Groq round trip
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "")  # e.g. "silicon_baap_cache.db" to survive restarts
+CACHE_SQLITE_MAX_ENTRIES = int(os.getenv("CACHE_SQLITE_MAX_ENTRIES", "50000"))
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"  # share in-flight duplicate calls
+CACHE_DISABLED_FEATURES = {f.strip() for f in os.getenv("CACHE_DISABLED_FEATURES", "").split(",") if f.strip()}
+# 🧮 Token budgeting - prompts are counted locally and fitted to each model's context window
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "4000"))
+MIN_COMPLETION_TOKENS = int(os.getenv("MIN_COMPLETION_TOKENS", "256"))
+CONTEXT_SAFETY_MARGIN = float(os.getenv("CONTEXT_SAFETY_MARGIN", "0.05"))  # headroom for estimator error
+CONTEXT_OVERFLOW = os.getenv("CONTEXT_OVERFLOW", "trim")  # trim | reject (413)
+TOKENIZER = os.getenv("TOKENIZER", "auto")  # auto (tiktoken if installed) | heuristic
+TOKEN_SAMPLE_CHARS = int(os.getenv("TOKEN_SAMPLE_CHARS", "16384"))  # longer text is estimated from samples
+GROQ_SAMPLING = {"temperature": 0.7, "max_tokens": MAX_COMPLETION_TOKENS}  # max_tokens is the ceiling, sized per request
+# ⏱️ Client-side Groq scheduler - per-model RPM/TPM token buckets, fair per-session queue, retries
+GROQ_DEFAULT_RPM = int(os.getenv("GROQ_DEFAULT_RPM", "30"))
+GROQ_DEFAULT_TPM = int(os.getenv("GROQ_DEFAULT_TPM", "60000"))
+GROQ_RATE_LIMITS = json.loads(os.getenv("GROQ_RATE_LIMITS", "{}"))  # {"model": {"rpm": 30, "tpm": 6000}}, 0 = unlimited
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))  # per model and worker, halved on 429 and regrown on success
+GROQ_QUEUE_MAX = int(os.getenv("GROQ_QUEUE_MAX", "256"))
+GROQ_QUEUE_TIMEOUT = float(os.getenv("GROQ_QUEUE_TIMEOUT", "60"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_RETRY_BASE_DELAY = float(os.getenv("GROQ_RETRY_BASE_DELAY", "0.5"))
+GROQ_RETRY_MAX_DELAY = float(os.getenv("GROQ_RETRY_MAX_DELAY", "20"))
+# 🔎 Language/domain analysis runs on worker threads alongside the Groq call
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "4096"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "86400"))
+# 🗄️ SQLite data layer - pooled connections on worker threads, never on the event loop
+DB_PATH = os.getenv("DB_PATH", "silicon_baap.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# 🔗 Multi-worker state - rate buckets, completion cache and upload progress shared through one SQLite file
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")  # `serve --workers N` (N > 1) defaults this to silicon_baap_shared.db
+SHARED_PROGRESS_INTERVAL = float(os.getenv("SHARED_PROGRESS_INTERVAL", "0.5"))  # seconds between progress snapshots
+# 📝 Write-behind logging - conversation/upload rows are committed in batches off the request path
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+WRITE_BEHIND_OVERFLOW = os.getenv("WRITE_BEHIND_OVERFLOW", "block")  # block | drop
+WRITE_BEHIND_BLOCK_TIMEOUT = float(os.getenv("WRITE_BEHIND_BLOCK_TIMEOUT", "2"))
+# 📤 Uploads - streamed to disk in chunks, content-addressed by SHA-256
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# 🗂️ Batch completions - /api/batch fans items out with bounded concurrency, results resumable by item id
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))  # cap on the per-request override
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(20 * 1024 * 1024)))  # uploaded JSONL
+# 🧵 Background jobs - SQLite queue with leases, priorities and retries; uploads and heavy features run here
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # per process; 0 = enqueue only (e.g. API-only nodes)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))  # a job whose worker stops renewing is reclaimed after this
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "2"))  # lease renewal + progress snapshot
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_SHUTDOWN_GRACE = float(os.getenv("JOB_SHUTDOWN_GRACE", "20"))  # running jobs past this are requeued on shutdown
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "72"))
+JOB_BACKGROUND_FEATURES = {f.strip() for f in os.getenv("JOB_BACKGROUND_FEATURES", "web_scraper,file_reader,zip_extractor,security_scanner").split(",") if f.strip()}
+UPLOAD_ASYNC = os.getenv("UPLOAD_ASYNC", "true").lower() == "true"  # uploads answer 202 + job_id unless wait=true
+# 📑 Document extraction - process pool, PDF page ranges fanned out across workers
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PDF_PAGES_PER_TASK = int(os.getenv("EXTRACT_PDF_PAGES_PER_TASK", "16"))
+EXTRACT_CACHE_SIZE = int(os.getenv("EXTRACT_CACHE_SIZE", "256"))
+EXTRACT_CACHE_TTL = float(os.getenv("EXTRACT_CACHE_TTL", "86400"))
+EXTRACT_CACHE_MAX_CHARS = int(os.getenv("EXTRACT_CACHE_MAX_CHARS", "32000000"))  # total extracted text held in memory
+# 🗃️ ZIP extraction budgets - members are streamed, never fully inflated in memory
+ZIP_MAX_TOTAL_BYTES = int(os.getenv("ZIP_MAX_TOTAL_BYTES", str(100 * 1024 * 1024)))
+ZIP_MAX_RATIO = float(os.getenv("ZIP_MAX_RATIO", "100"))
+ZIP_MAX_MEMBERS = int(os.getenv("ZIP_MAX_MEMBERS", "2000"))
+ZIP_MAX_MEMBER_BYTES = int(os.getenv("ZIP_MAX_MEMBER_BYTES", str(20 * 1024 * 1024)))  # pdf/docx need a seekable copy
+ZIP_CHUNK_CHARS = int(os.getenv("ZIP_CHUNK_CHARS", "65536"))
+ZIP_MAX_TEXT_CHARS = int(os.getenv("ZIP_MAX_TEXT_CHARS", "1000000"))  # text kept per archive; reading stops here
+# 🧭 Model routing for model="auto" - category, prompt length and observed latency/error rates
+ROUTER_SHORT_PROMPT_CHARS = int(os.getenv("ROUTER_SHORT_PROMPT_CHARS", "400"))
+ROUTER_SLOW_MS = float(os.getenv("ROUTER_SLOW_MS", "15000"))  # EWMA latency above this marks a model as slow
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_RECOVERY_SECONDS = float(os.getenv("ROUTER_RECOVERY_SECONDS", "60"))  # unhealthy models get probed again after this
+# 🪁 Hedged requests (opt-in) - a backup attempt fires when the primary outlives the latency percentile
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "500"))
+HEDGE_DEFAULT_DELAY_MS = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "5000"))  # until enough samples exist
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))  # hedges may add at most 10% extra upstream calls
+HEDGE_ALTERNATE_MODEL = os.getenv("HEDGE_ALTERNATE_MODEL", "true").lower() == "true"  # back up on the next routed candidate
+# 🧩 Map-reduce summarization of large documents
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))  # cap below the model context
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MAX_CHUNKS = int(os.getenv("SUMMARY_MAX_CHUNKS", "32"))
+SUMMARY_MAX_ROUNDS = int(os.getenv("SUMMARY_MAX_ROUNDS", "3"))
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(5 * 1024 * 1024)))  # web_scraper reads at most this much of a page
+# 📜 Conversation history paging
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
 # 🎯 SILICON VALLEY KA BAAP MODELS - UPDATED TO CURRENT GROQ MODELS (2025)
 SILICON_BAAP_MODELS = {
     "llama-3.3-70b-versatile": {"name": "🦙 Llama 3.3 70B - GPT-5 Ka Baap", "context": 131072, "type": "ultimate"},
@@ -38,8 +167,8 @@ SILICON_BAAP_MODELS = {
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("SiliconValleyKaBaapAI")
 # ====================== CREATE UI FILES FIRST ======================
-def create_ui_files():
-    """Create all UI files (CSS, JS, HTML)"""
+def create_ui_files() -> Dict[str, str]:
+    """UI file contents (CSS, JS, HTML) keyed by path - written by build_ui_assets()"""
     # Create CSS file
     css_content = '''
     :root {
@@ -111,15 +240,12 @@ def create_ui_files():
     .search-input { width: 100%; padding: 8px 12px; background: var(--background); border: 1px solid var(--border); border-radius: 6px; color: var(--text); font-size: 14px; }
     .search-input:focus { outline: none; border-color: var(--primary); }
     '''
-    with open("static/css/main.css", "w", encoding='utf-8') as f:
-        f.write(css_content)
-    logger.info("✅ Created CSS file")
     # Create JavaScript file
     js_content = '''
     class SiliconBaapAI {
         constructor() {
             this.currentFeature = 'chat';
-            this.currentModel = 'llama-3.3-70b-versatile';
+            this.currentModel = 'auto';
             this.isProcessing = false;
             this.sessionId = this.generateSessionId();
             this.conversationHistory = [];
@@ -155,20 +281,34 @@ def create_ui_files():
             input.value = ''; input.style.height = 'auto';
             this.showTypingIndicator(); this.isProcessing = true; this.updateSendButton();
             try {
-                const response = await this.apiCall('/api/chat', {
-                    feature: this.currentFeature,
-                    message: message,
-                    model: this.currentModel,
-                    session_id: this.sessionId
+                const response = await fetch('/api/chat/stream', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                    body: JSON.stringify({ feature: this.currentFeature, message: message, model: this.currentModel, session_id: this.sessionId })
                 });
-                if (response && response.status === 'success') {
-                    this.hideTypingIndicator();
-                    this.addMessageToUI('ai', response.response, this.currentFeature, response.model, response.detected_language, response.detected_domain);
-                    this.saveToHistory('user', message, this.currentFeature);
-                    this.saveToHistory('ai', response.response, this.currentFeature, response.model);
-                } else {
-                    throw new Error(response?.error || 'Unknown error occurred');
-                }
+                if (!response.ok || !response.body) { throw new Error(await response.text()); }
+                let messageDiv = null, fullText = '', result = null;
+                await this.readEventStream(response, (event, data) => {
+                    if (event === 'meta') {
+                        this.hideTypingIndicator();
+                        messageDiv = this.addMessageToUI('ai', '', this.currentFeature, data.model);
+                    } else if (event === 'token') {
+                        fullText += data.delta;
+                        messageDiv.querySelector('.message-content').textContent = fullText;
+                        const messagesContainer = document.getElementById('messagesContainer');
+                        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                    } else if (event === 'done') {
+                        result = data;
+                    } else if (event === 'error') {
+                        throw new Error(data.error || 'Unknown error occurred');
+                    }
+                });
+                if (!result || result.status !== 'success') { throw new Error(result?.error || 'Stream ended unexpectedly'); }
+                const finalText = result.response || result.analysis || result.security_report || fullText;
+                messageDiv.querySelector('.message-content').textContent = finalText;
+                this.addDetectionInfo(messageDiv, result.detected_language, result.detected_domain);
+                this.saveToHistory('user', message, this.currentFeature);
+                this.saveToHistory('ai', finalText, this.currentFeature, result.model);
             } catch (error) {
                 this.hideTypingIndicator();
                 this.addMessageToUI('ai', '❌ Error: ' + error.message, this.currentFeature);
@@ -192,7 +332,9 @@ def create_ui_files():
                 formData.append('session_id', this.sessionId);
                 const response = await fetch('/api/upload', { method: 'POST', body: formData });
                 if (!response.ok) { throw new Error(await response.text()); }
-                const data = await response.json(); this.hideTypingIndicator();
+                let data = await response.json();
+                if (data.job_id) { data = await this.waitForJob(data.job_id); }
+                this.hideTypingIndicator();
                 if (data.status === 'success') {
                     this.addMessageToUI('user', '📁 Uploaded file: ' + file.name, this.currentFeature);
                     this.addMessageToUI('ai', data.response, this.currentFeature, data.model, data.detected_language, data.detected_domain);
@@ -230,19 +372,43 @@ def create_ui_files():
             content.textContent = message;
             messageDiv.appendChild(header);
             messageDiv.appendChild(content);
-            if (sender === 'ai' && (detectedLanguage || detectedDomain)) {
-                const detectionInfo = document.createElement('div');
-                detectionInfo.className = 'detection-info';
-                if (detectedLanguage) {
-                    detectionInfo.innerHTML += '<span class="detection-badge">' + detectedLanguage + '</span>';
-                }
-                if (detectedDomain) {
-                    detectionInfo.innerHTML += '<span class="detection-badge">' + detectedDomain + '</span>';
-                }
-                messageDiv.appendChild(detectionInfo);
-            }
+            if (sender === 'ai') { this.addDetectionInfo(messageDiv, detectedLanguage, detectedDomain); }
             messagesContainer.appendChild(messageDiv);
             messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            return messageDiv;
+        }
+        addDetectionInfo(messageDiv, detectedLanguage, detectedDomain) {
+            if (!detectedLanguage && !detectedDomain) return;
+            const detectionInfo = document.createElement('div');
+            detectionInfo.className = 'detection-info';
+            if (detectedLanguage) {
+                detectionInfo.innerHTML += '<span class="detection-badge">' + detectedLanguage + '</span>';
+            }
+            if (detectedDomain) {
+                detectionInfo.innerHTML += '<span class="detection-badge">' + detectedDomain + '</span>';
+            }
+            messageDiv.appendChild(detectionInfo);
+        }
+        async readEventStream(response, onEvent) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message', data = '';
+                    block.split('\\n').forEach(line => {
+                        if (line.startsWith('event:')) { event = line.slice(6).trim(); }
+                        else if (line.startsWith('data:')) { data += line.slice(5).trim(); }
+                    });
+                    if (data) { onEvent(event, JSON.parse(data)); }
+                }
+            }
         }
         showTypingIndicator() {
             const messagesContainer = document.getElementById('messagesContainer');
@@ -337,6 +503,7 @@ def create_ui_files():
         }
         getModelName(model) {
             const models = {
+                'auto': '🧭 Auto',
                 'llama-3.3-70b-versatile': '🦙 Llama 3.3 70B',
                 'llama-3.1-8b-instant': '⚡ Llama 3.1 8B Instant',
                 'qwen/qwen3-32b': '🎯 Qwen 3 32B',
@@ -344,6 +511,16 @@ def create_ui_files():
             };
             return models[model] || model;
         }
+        async waitForJob(jobId) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const response = await fetch('/api/jobs/' + jobId);
+                if (!response.ok) { throw new Error(await response.text()); }
+                const job = await response.json();
+                if (job.status === 'succeeded') { return job.result; }
+                if (job.status === 'failed' || job.status === 'cancelled') { throw new Error(job.error || 'Job ' + job.status); }
+            }
+        }
         async apiCall(endpoint, data) {
             const response = await fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(data) });
             if (!response.ok) { throw new Error(await response.text()); }
@@ -366,9 +543,6 @@ def create_ui_files():
     }
     document.addEventListener('DOMContentLoaded', function() { window.siliconBaap = new SiliconBaapAI(); });
     '''
-    with open("static/js/app.js", "w", encoding='utf-8') as f:
-        f.write(js_content)
-    logger.info("✅ Created JavaScript file")
     # Create HTML file
     html_content = '''
     <!DOCTYPE html>
@@ -507,6 +681,7 @@ def create_ui_files():
                     <div class="current-feature" id="currentFeature">AI Chat Assistant</div>
                     <div class="header-controls">
                         <select class="model-selector" id="modelSelect">
+                            <option value="auto">🧭 Auto - Fastest Adequate Model</option>
                             <option value="llama-3.3-70b-versatile">🦙 Llama 3.3 70B - GPT-5 Ka Baap</option>
                             <option value="llama-3.1-8b-instant">⚡ Llama 3.1 8B Instant - Grok Ka Baap</option>
                             <option value="qwen/qwen3-32b">🎯 Qwen 3 32B - Mixtral Ka Baap</option>
@@ -566,42 +741,204 @@ def create_ui_files():
     </body>
     </html>
     '''
-    with open("templates/index.html", "w", encoding='utf-8') as f:
-        f.write(html_content)
-    logger.info("✅ Created HTML template")
-# ====================== FORCE CREATE DIRECTORIES ======================
-def force_create_directories():
-    """Force create all required directories and files"""
-    directories = [
-        "static/css",
-        "static/js",
-        "static/images",
-        "static/audio",
-        "uploads",
-        "templates"
-    ]
-    for directory in directories:
+    return {"static/css/main.css": css_content, "static/js/app.js": js_content, "templates/index.html": html_content}
+# ====================== UI ASSET BUILD 🏗️ ======================
+UI_DIRECTORIES = ("static/css", "static/js", "static/images", "static/audio", "uploads", "templates")
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.replace("\r\n", "\n").encode("utf-8")).hexdigest()  # checkouts may be CRLF
+def build_ui_assets(force: bool = False) -> Dict[str, bool]:
+    """Write the UI files only when their content hash differs from disk (`python main.py build-assets`).
+    Returns {path: written}"""
+    for directory in UI_DIRECTORIES:
         Path(directory).mkdir(parents=True, exist_ok=True)
-        logger.info(f"✅ Created directory: {directory}")
-    # Create the UI files
-    create_ui_files()
-# Call this immediately
-force_create_directories()
+    results = {}
+    for path, content in create_ui_files().items():
+        target = Path(path)
+        try:
+            current = _content_hash(target.read_text(encoding="utf-8")) if target.exists() else None
+        except (OSError, UnicodeDecodeError):
+            current = None
+        written = force or current != _content_hash(content)
+        if written:
+            target.write_text(content, encoding="utf-8")
+            logger.info(f"✅ Built {path}")
+        results[path] = written
+    return results
+# ====================== ASSET PIPELINE 📦 ======================
+FINGERPRINTED_ASSETS = {"static/css/main.css": "text/css; charset=utf-8", "static/js/app.js": "application/javascript; charset=utf-8"}
+LANDING_PAGE = "templates/index.html"
+class CompiledAsset:
+    """One response body held in memory with its precompressed variants and per-variant ETags"""
+    def __init__(self, body: bytes, media_type: str, compressors: Dict[str, Any]):
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {"identity": body}
+        for encoding, compress in compressors.items():
+            compressed = compress(body)
+            if len(compressed) < len(body):
+                self.variants[encoding] = compressed
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+class AssetPipeline:
+    """Fingerprints and precompresses the UI bundle once, then serves it from memory.
+    CSS/JS get content-hashed URLs (/assets/main.<hash>.css) with immutable caching; the landing page
+    is rendered once with those URLs and revalidated by ETag, so a deploy is picked up on the next load"""
+    def __init__(self, gzip_level: int = ASSET_GZIP_LEVEL, brotli_mode: str = ASSET_BROTLI, max_age: int = ASSET_MAX_AGE):
+        self.max_age = max_age
+        self.compressors: Dict[str, Any] = {}
+        if brotli_mode != "off":
+            try:
+                import brotli
+                self.compressors["br"] = lambda body: brotli.compress(body, quality=11)
+            except ImportError:
+                logger.info("brotli not installed - serving gzip only")
+        self.compressors["gzip"] = lambda body: gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        self.assets: Dict[str, CompiledAsset] = {}
+        self.urls: Dict[str, str] = {}
+        self.landing: Optional[CompiledAsset] = None
+    def load(self) -> "AssetPipeline":
+        for path, media_type in FINGERPRINTED_ASSETS.items():
+            asset = CompiledAsset(Path(path).read_bytes(), media_type, self.compressors)
+            stem, suffix = os.path.splitext(os.path.basename(path))
+            name = f"{stem}.{asset.digest[:10]}{suffix}"
+            self.assets[name] = asset
+            self.urls["/" + path] = f"/assets/{name}"
+        html = Path(LANDING_PAGE).read_text(encoding="utf-8")
+        for plain, fingerprinted in self.urls.items():
+            html = html.replace(f'"{plain}"', f'"{fingerprinted}"')
+        self.landing = CompiledAsset(html.encode("utf-8"), "text/html; charset=utf-8", self.compressors)
+        logger.info(f"📦 Assets ready: {', '.join(self.assets)} ({', '.join(self.compressors)})")
+        return self
+    def response(self, request: Request, asset: CompiledAsset, cache_control: str) -> Response:
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in asset.variants and e in accepted), "identity")
+        headers = {"ETag": asset.etag(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            # weak comparison; proxies that recompress turn strong ETags into W/ ones
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or tags & {asset.etag(e) for e in asset.variants}:
+                return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
+    def serve(self, request: Request, name: str) -> Response:
+        asset = self.assets.get(name)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Unknown asset")
+        return self.response(request, asset, f"public, max-age={self.max_age}, immutable")
+    def serve_landing(self, request: Request) -> Response:
+        return self.response(request, self.landing, "no-cache")
 # ====================== DATABASE 🗄️ ======================
-def get_db():
-    conn = sqlite3.connect("silicon_baap.db", check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
-def init_database():
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+class Database:
+    """Bounded SQLite connection pool with async wrappers (queries run on a dedicated thread pool).
+    `setup(conn)` runs once, on the first connection - nothing touches the file until the pool is used"""
+    def __init__(self, path: str, pool_size: int = DB_POOL_SIZE, setup=None):
+        self.path = path
+        self.pool_size = pool_size
+        self._setup = setup
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sqlite")
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.pool_size:
+                conn = self._connect()
+                if self._setup is not None:
+                    self._setup, setup = None, self._setup
+                    try:
+                        setup(conn)
+                    except BaseException:
+                        self._setup = setup
+                        conn.close()
+                        raise
+                self._all.append(conn)
+                return conn
+        return self._idle.get()
+    def run_sync(self, fn):
+        """Run fn(conn) on a pooled connection in the calling thread"""
+        conn = self._acquire()
+        try:
+            return fn(conn)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+    async def run(self, fn):
+        """Run fn(conn) on a pooled connection without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.run_sync, fn)
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        def op(conn):
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        return await self.run(op)
+    async def executemany(self, sql: str, rows: List[tuple]) -> int:
+        def op(conn):
+            cursor = conn.executemany(sql, rows)
+            conn.commit()
+            return cursor.rowcount
+        return await self.run(op)
+    async def fetchall(self, sql: str, params: tuple = ()) -> List[Dict]:
+        return await self.run(lambda conn: [dict(row) for row in conn.execute(sql, params).fetchall()])
+    async def fetchone(self, sql: str, params: tuple = ()) -> Optional[Dict]:
+        def op(conn):
+            row = conn.execute(sql, params).fetchone()
+            return dict(row) if row is not None else None
+        return await self.run(op)
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+        self._idle = queue.LifoQueue(maxsize=self.pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="sqlite")
+    def stats(self) -> Dict:
+        return {"path": self.path, "pool_size": self.pool_size, "open_connections": len(self._all), "idle_connections": self._idle.qsize()}
+def _schema_v1(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT UNIQUE,
         name TEXT,
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS usage_stats (
+    conn.execute('''CREATE TABLE IF NOT EXISTS usage_stats (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
         feature TEXT,
@@ -609,14 +946,14 @@ def init_database():
         tokens_used INTEGER,
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
     )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS uploaded_files (
+    conn.execute('''CREATE TABLE IF NOT EXISTS uploaded_files (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         filename TEXT,
         file_type TEXT,
         content TEXT,
         uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS conversations (
+    conn.execute('''CREATE TABLE IF NOT EXISTS conversations (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         session_id TEXT,
         feature TEXT,
@@ -625,11 +962,615 @@ def init_database():
         model_used TEXT,
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
     )''')
-    conn.commit()
-    conn.close()
-init_database()
+    # Keyset pagination walks (session_id, timestamp, id) straight off this index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_session_ts ON conversations(session_id, timestamp, id)")
+def _schema_v2(conn: sqlite3.Connection):
+    _add_missing_columns(conn, "usage_stats", {"prompt_tokens": "INTEGER", "completion_tokens": "INTEGER", "session_id": "TEXT"})
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_stats_ts ON usage_stats(timestamp)")
+def _schema_v3(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS batch_results (
+        batch_id TEXT,
+        item_id TEXT,
+        status TEXT,
+        result TEXT,
+        completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (batch_id, item_id)
+    )''')
+def _schema_v4(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT,
+        payload TEXT,
+        status TEXT,
+        priority INTEGER DEFAULT 0,
+        attempts INTEGER DEFAULT 0,
+        max_attempts INTEGER,
+        run_after REAL,
+        lease_owner TEXT,
+        lease_expires REAL,
+        cancel_requested INTEGER DEFAULT 0,
+        progress TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL,
+        started_at REAL,
+        finished_at REAL,
+        updated_at REAL
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(status, lease_expires)")
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+# Append-only: MIGRATIONS[n - 1] takes the schema to PRAGMA user_version n. Earlier steps stay
+# idempotent so databases created before versioning (user_version 0) upgrade cleanly.
+MIGRATIONS = [_schema_v1, _schema_v2, _schema_v3, _schema_v4]
+def migrate_database(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations, each in its own IMMEDIATE transaction so concurrent workers serialize"""
+    for version, migration in enumerate(MIGRATIONS, 1):
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:  # another worker may have got here first
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                logger.info(f"🗄️ Database migrated to schema v{version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS)
+db = Database(DB_PATH, setup=migrate_database)
+def init_database():
+    """Force the schema up to date now instead of on first use"""
+    db.run_sync(lambda conn: None)
+class WriteBehindQueue:
+    """Buffers INSERTs and commits them in batched transactions on size/time thresholds.
+    When the queue is full the overflow policy applies: "block" waits up to
+    WRITE_BEHIND_BLOCK_TIMEOUT then writes directly, "drop" discards the row."""
+    _STOP = object()
+    def __init__(self, database: Database, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL, max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+                 overflow: str = WRITE_BEHIND_OVERFLOW):
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"Unknown write-behind overflow policy: {overflow}")
+        self.db = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"enqueued": 0, "flushed_rows": 0, "batches": 0, "dropped": 0, "direct_writes": 0, "failed_rows": 0}
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"✅ Write-behind queue started (batch={self.batch_size}, interval={self.flush_interval}s, policy={self.overflow})")
+    async def put(self, sql: str, params: tuple):
+        if not self.running:
+            # No writer loop (e.g. app used without its lifespan) - write through
+            self.counters["direct_writes"] += 1
+            await self.db.execute(sql, params)
+            return
+        try:
+            self._queue.put_nowait((sql, params))
+        except asyncio.QueueFull:
+            if self.overflow == "drop":
+                self.counters["dropped"] += 1
+                logger.warning("Write-behind queue full - dropping row")
+                return
+            try:
+                await asyncio.wait_for(self._queue.put((sql, params)), WRITE_BEHIND_BLOCK_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.counters["direct_writes"] += 1
+                await self.db.execute(sql, params)
+                return
+        self.counters["enqueued"] += 1
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # Drain anything still queued behind the stop marker
+        leftovers = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not self._STOP:
+                leftovers.append(item)
+        if leftovers:
+            await self._flush(leftovers)
+    async def _flush(self, batch: List[tuple]):
+        grouped: "OrderedDict[str, List[tuple]]" = OrderedDict()
+        for sql, params in batch:
+            grouped.setdefault(sql, []).append(params)
+        def op(conn):
+            for sql, rows in grouped.items():
+                conn.executemany(sql, rows)
+            conn.commit()
+        try:
+            await self.db.run(op)
+            self.counters["flushed_rows"] += len(batch)
+            self.counters["batches"] += 1
+        except Exception as e:
+            self.counters["failed_rows"] += len(batch)
+            logger.error(f"Write-behind flush of {len(batch)} rows failed: {e}")
+    async def stop(self):
+        if not self.running:
+            return
+        await self._queue.put(self._STOP)
+        await self._task
+        self._task = None
+        logger.info(f"🛑 Write-behind queue drained ({self.counters['flushed_rows']} rows in {self.counters['batches']} batches)")
+    def stats(self) -> Dict:
+        return {**self.counters, "queue_depth": self._queue.qsize() if self.running else 0, "running": self.running}
+write_behind = WriteBehindQueue(db)
+async def log_row(sql: str, params: tuple):
+    if WRITE_BEHIND_ENABLED:
+        await write_behind.put(sql, params)
+    else:
+        await db.execute(sql, params)
+_background_tasks: set = set()
+def spawn_background(coro) -> asyncio.Task:
+    """Fire-and-forget task that is kept referenced until it finishes"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+# ====================== SHARED STATE 🔗 ======================
+class SharedState:
+    """Cross-process state for multi-worker deployments, in one local SQLite file (WAL): per-model
+    request/token buckets and 429 pauses, plus a small TTL key-value table for progress snapshots.
+    Each rate admission is a single BEGIN IMMEDIATE transaction, so workers can't overdraw a bucket."""
+    def __init__(self, path: str):
+        self.path = path
+        self.db = Database(path, pool_size=2, setup=self._create_tables)
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.execute('''CREATE TABLE IF NOT EXISTS rate_buckets (
+            model TEXT PRIMARY KEY,
+            requests REAL,
+            tokens REAL,
+            updated REAL,
+            blocked_until REAL
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS shared_kv (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            expires_at REAL
+        )''')
+        conn.commit()
+    @staticmethod
+    def _load_buckets(conn: sqlite3.Connection, model: str, rpm: float, tpm: float, now: float):
+        requests, tokens = TokenBucket(rpm), TokenBucket(tpm)
+        requests.updated = tokens.updated = now
+        blocked_until = 0.0
+        row = conn.execute("SELECT requests, tokens, updated, blocked_until FROM rate_buckets WHERE model = ?", (model,)).fetchone()
+        if row is not None:
+            requests.level, tokens.level = row["requests"], row["tokens"]
+            requests.updated = tokens.updated = min(now, row["updated"])
+            blocked_until = row["blocked_until"]
+        requests._refill(now)
+        tokens._refill(now)
+        return requests, tokens, blocked_until
+    @staticmethod
+    def _save_buckets(conn: sqlite3.Connection, model: str, requests: "TokenBucket", tokens: "TokenBucket", now: float, blocked_until: float):
+        conn.execute("INSERT OR REPLACE INTO rate_buckets (model, requests, tokens, updated, blocked_until) VALUES (?, ?, ?, ?, ?)",
+                     (model, requests.level, tokens.level, now, blocked_until))
+    async def admit(self, model: str, rpm: float, tpm: float, amount: int) -> float:
+        """Charge one request and `amount` tokens and return 0.0, or return the seconds to wait"""
+        def op(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            requests, tokens, blocked_until = self._load_buckets(conn, model, rpm, tpm, now)
+            delay = max(blocked_until - now, requests.delay(1, now), tokens.delay(amount, now))
+            if delay <= 0:
+                requests.take(1)
+                tokens.take(amount)
+                self._save_buckets(conn, model, requests, tokens, now, blocked_until)
+            conn.commit()
+            return delay
+        return await self.db.run(op)
+    async def settle(self, model: str, rpm: float, tpm: float, requests_back: int = 0, tokens_back: int = 0,
+                     remaining_tokens: Optional[int] = None, pause: Optional[float] = None):
+        """Refund unused reservations, clamp to Groq's reported remaining tokens, extend a 429 pause"""
+        def op(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            requests, tokens, blocked_until = self._load_buckets(conn, model, rpm, tpm, now)
+            requests.give(requests_back)
+            tokens.give(tokens_back)
+            if remaining_tokens is not None:
+                tokens.sync(remaining_tokens)
+            if pause:
+                blocked_until = max(blocked_until, now + pause)
+            self._save_buckets(conn, model, requests, tokens, now, blocked_until)
+            conn.commit()
+        await self.db.run(op)
+    async def put(self, key: str, value: Any, ttl: float = 3600):
+        """`value` is serialized before this returns control, so live dicts can be passed"""
+        await self.db.execute("INSERT OR REPLACE INTO shared_kv (key, value, expires_at) VALUES (?, ?, ?)",
+                              (key, json.dumps(value), time.time() + ttl))
+    async def get(self, key: str) -> Optional[Any]:
+        row = await self.db.fetchone("SELECT value FROM shared_kv WHERE key = ? AND expires_at > ?", (key, time.time()))
+        return json.loads(row["value"]) if row else None
+    async def purge(self) -> int:
+        def op(conn):
+            deleted = conn.execute("DELETE FROM shared_kv WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.commit()
+            return deleted
+        return await self.db.run(op)
+    def close(self):
+        self.db.close()
+shared_state: Optional[SharedState] = SharedState(SHARED_STATE_PATH) if SHARED_STATE_PATH else None
+# ====================== DOCUMENT EXTRACTION 📑 ======================
+# Module-level so they can be pickled into the extraction process pool. PyPDF2/python-docx are
+# imported on first use to keep them off the startup path.
+def _pdf_page_count(file_path: str) -> int:
+    import PyPDF2
+    with open(file_path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+def _pdf_text(stream, start: int = 0, end: Optional[int] = None) -> str:
+    import PyPDF2
+    reader = PyPDF2.PdfReader(stream)
+    texts = []
+    for page in reader.pages[start:end]:
+        text = page.extract_text()  # once per page
+        if text:
+            texts.append(text)
+    return " ".join(texts)
+def _extract_pdf_pages(file_path: str, start: int = 0, end: Optional[int] = None) -> str:
+    with open(file_path, 'rb') as f:
+        return _pdf_text(f, start, end)
+def _docx_text(source) -> str:
+    from docx import Document
+    doc = Document(source)
+    return " ".join(paragraph.text for paragraph in doc.paragraphs)
+def _extract_document(file_path: str, file_type: str) -> str:
+    if file_type == "pdf":
+        return _extract_pdf_pages(file_path)
+    elif file_type == "txt":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    elif file_type == "docx":
+        return _docx_text(file_path)
+    elif file_type == "csv":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            return " ".join([", ".join(row) for row in reader])
+    else:
+        return f"Unsupported file type: {file_type}"
+SHA256_NAME = re.compile(r"[0-9a-f]{64}")
+def _file_sha256(file_path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+# ====================== ZIP STREAMING 🗃️ ======================
+ZIP_TEXT_EXTENSIONS = {
+    "txt", "md", "rst", "log", "json", "xml", "yml", "yaml", "toml", "ini", "cfg",
+    "py", "js", "ts", "jsx", "tsx", "java", "c", "h", "cpp", "hpp", "cs", "go", "rs", "rb", "php",
+    "swift", "kt", "scala", "sql", "sh", "bash", "html", "css", "scss", "r", "lua", "pl", "dart",
+}
+class ZipBudgetExceeded(Exception):
+    pass
+class _BudgetedMemberReader(io.RawIOBase):
+    """Counts the bytes actually inflated from a member and stops at the archive budget or
+    when the member inflates past its compression-ratio allowance (headers can lie)"""
+    def __init__(self, raw, budget: Dict[str, int], member_limit: int):
+        self._raw = raw
+        self._budget = budget
+        self._member_limit = member_limit
+        self._read = 0
+    def readable(self) -> bool:
+        return True
+    def readinto(self, buffer) -> int:
+        data = self._raw.read(len(buffer))
+        self._read += len(data)
+        self._budget["used"] += len(data)
+        if self._budget["used"] > self._budget["limit"]:
+            raise ZipBudgetExceeded(f"archive exceeds {self._budget['limit']} decompressed bytes")
+        if self._read > self._member_limit:
+            raise ZipBudgetExceeded(f"member inflates beyond {self._member_limit} bytes")
+        buffer[:len(data)] = data
+        return len(data)
+def iter_zip_content(zip_path: str, max_total_bytes: int = ZIP_MAX_TOTAL_BYTES, max_ratio: float = ZIP_MAX_RATIO,
+                     chunk_chars: int = ZIP_CHUNK_CHARS) -> Iterator[str]:
+    """Walk archive members lazily and yield extracted text in chunks.
+    Each supported member (text/code, csv, pdf, docx) goes to its extractor; total inflated
+    bytes and per-member compression ratio are enforced while reading."""
+    budget = {"used": 0, "limit": max_total_bytes}
+    members = 0
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if members >= ZIP_MAX_MEMBERS:
+                yield f"⚠️ Stopped after {ZIP_MAX_MEMBERS} members\n"
+                return
+            members += 1
+            yield f"📁 File: {info.filename}\n"
+            extension = info.filename.rsplit('.', 1)[-1].lower() if '.' in info.filename else ""
+            if extension not in ZIP_TEXT_EXTENSIONS and extension not in ("csv", "pdf", "docx"):
+                continue
+            if info.compress_size and info.file_size / info.compress_size > max_ratio:
+                yield f"⚠️ Skipped {info.filename}: compression ratio above {max_ratio:g}\n"
+                continue
+            member_limit = int(max(info.compress_size, 1) * max_ratio)
+            try:
+                with archive.open(info) as raw:
+                    reader = io.BufferedReader(_BudgetedMemberReader(raw, budget, member_limit))
+                    if extension in ZIP_TEXT_EXTENSIONS or extension == "csv":
+                        text = io.TextIOWrapper(reader, encoding='utf-8', errors='replace', newline='')
+                        if extension == "csv":
+                            rows = []
+                            size = 0
+                            for row in csv.reader(text):
+                                line = ", ".join(row)
+                                rows.append(line)
+                                size += len(line)
+                                if size >= chunk_chars:
+                                    yield " ".join(rows) + "\n"
+                                    rows, size = [], 0
+                            if rows:
+                                yield " ".join(rows) + "\n"
+                        else:
+                            for chunk in iter(lambda: text.read(chunk_chars), ""):
+                                yield chunk
+                            yield "\n"
+                    else:
+                        if info.file_size > ZIP_MAX_MEMBER_BYTES:
+                            yield f"⚠️ Skipped {info.filename}: larger than {ZIP_MAX_MEMBER_BYTES} bytes\n"
+                            continue
+                        data = io.BytesIO(reader.read(ZIP_MAX_MEMBER_BYTES + 1))
+                        if len(data.getbuffer()) > ZIP_MAX_MEMBER_BYTES:
+                            yield f"⚠️ Skipped {info.filename}: larger than {ZIP_MAX_MEMBER_BYTES} bytes\n"
+                            continue
+                        yield (_pdf_text(data) if extension == "pdf" else _docx_text(data)) + "\n"
+            except ZipBudgetExceeded as e:
+                yield f"⚠️ Stopped at {info.filename}: {str(e)}\n"
+                if budget["used"] > budget["limit"]:
+                    return
+            except Exception as e:
+                yield f"❌ Error reading {info.filename}: {str(e)}\n"
 # ====================== AI UTILITIES 🤖 ======================
+class LanguageDetector:
+    """Compiled language scorer built once from the pattern table.
+    Literal word patterns (r"word\\s+", r"two\\s+words\\s+") are scored from a single token pass,
+    plain literals via str.count, and the remaining regexes are compiled once and shared
+    between languages that use the same pattern. Scores match the per-pattern findall counts."""
+    _LITERAL_WORDS = re.compile(r"^(?:[^\W\d_]+\\s\+)+$")
+    _REGEX_CHARS = set(".^$*+?{}[]\\|()")
+    _TOKEN = re.compile(r"\S+(?=\s)")
+    def __init__(self, language_patterns: Dict[str, List[str]]):
+        self.languages = list(language_patterns)
+        self._words: Dict[str, Dict[str, int]] = {}          # word -> {lang: weight}, matched as token suffix
+        self._phrases: Dict[str, List[tuple]] = {}           # first word -> [(following words, lang)]
+        self._literals: Dict[str, Dict[str, int]] = {}       # plain substring -> {lang: weight}
+        regexes: Dict[str, Dict[str, int]] = {}
+        for lang, patterns in language_patterns.items():
+            for pattern in patterns:
+                if self._LITERAL_WORDS.match(pattern):
+                    words = pattern.lower().split("\\s+")[:-1]
+                    if len(words) == 1:
+                        weights = self._words.setdefault(words[0], {})
+                        weights[lang] = weights.get(lang, 0) + 1
+                    else:
+                        self._phrases.setdefault(words[0], []).append((tuple(words[1:]), lang))
+                elif not self._REGEX_CHARS.intersection(pattern):
+                    weights = self._literals.setdefault(pattern.lower(), {})
+                    weights[lang] = weights.get(lang, 0) + 1
+                else:
+                    weights = regexes.setdefault(pattern, {})
+                    weights[lang] = weights.get(lang, 0) + 1
+        # Regexes run against the already-lowercased text when that is equivalent to IGNORECASE
+        # (no uppercase escapes like \S or \W) - case-folding matching is several times slower
+        self._regexes = []
+        for pattern, weights in regexes.items():
+            if re.search(r"\\[A-Z]", pattern):
+                self._regexes.append((re.compile(pattern, re.IGNORECASE), weights, False))
+            else:
+                self._regexes.append((re.compile(pattern.lower()), weights, True))
+        self._suffix_lengths = sorted({len(w) for w in self._words} | {len(w) for w in self._phrases})
+        self._token_cache: Dict[str, tuple] = {}
+    def _token_hits(self, token: str) -> tuple:
+        """(word weights, phrase heads) for every indexed word the token ends with - memoised per token"""
+        hits = self._token_cache.get(token)
+        if hits is None:
+            weights: Dict[str, int] = {}
+            heads = []
+            size = len(token)
+            for length in self._suffix_lengths:
+                if length > size:
+                    break
+                suffix = token[size - length:]
+                for lang, weight in self._words.get(suffix, {}).items():
+                    weights[lang] = weights.get(lang, 0) + weight
+                if suffix in self._phrases:
+                    heads.append(suffix)
+            hits = (weights, heads)
+            if len(self._token_cache) < 50000:
+                self._token_cache[token] = hits
+        return hits
+    def scores(self, text: str) -> Dict[str, int]:
+        scores = dict.fromkeys(self.languages, 0)
+        lowered = text.lower()
+        tokens = self._TOKEN.findall(lowered)
+        phrase_positions = []
+        for token, count in Counter(tokens).items():
+            weights, heads = self._token_hits(token)
+            for lang, weight in weights.items():
+                scores[lang] += weight * count
+            if heads:
+                phrase_positions.append((token, heads))
+        if phrase_positions:
+            head_tokens = dict(phrase_positions)
+            for index, token in enumerate(tokens):
+                for head in head_tokens.get(token, ()):
+                    for tail, lang in self._phrases[head]:
+                        if tuple(tokens[index + 1:index + 1 + len(tail)]) == tail:
+                            scores[lang] += 1
+        for literal, weights in self._literals.items():
+            found = lowered.count(literal)
+            if found:
+                for lang, weight in weights.items():
+                    scores[lang] += weight * found
+        for regex, weights, on_lowered in self._regexes:
+            found = len(regex.findall(lowered if on_lowered else text))
+            if found:
+                for lang, weight in weights.items():
+                    scores[lang] += weight * found
+        return scores
+def load_domain_taxonomy(path: str) -> Dict[str, Dict]:
+    """Domain taxonomy data file: {"domain": {"emoji": "🤖", "keywords": ["..."]}, ...}"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Domain taxonomy {path} could not be loaded: {e} - domain detection disabled")
+        return {}
+class DomainIndex:
+    """Keyword -> domain index built once; a text is scored from a single tokenization pass.
+    Keywords match whole words (multi-word and "ci/cd" style keywords as word sequences);
+    keywords of PREFIX_MIN_LENGTH+ letters also match as word prefixes (hack -> hacking)."""
+    PREFIX_MIN_LENGTH = 4
+    _TOKEN = re.compile(r"\w+")
+    def __init__(self, taxonomy: Dict[str, Dict]):
+        self.taxonomy = taxonomy
+        self.domains = list(taxonomy)
+        self.emojis = {domain: info.get("emoji", "🎯") for domain, info in taxonomy.items()}
+        self._keyword_domains: List[List[str]] = []
+        self._words: Dict[str, List[int]] = {}          # word -> keyword ids
+        self._phrases: Dict[str, List[tuple]] = {}      # first word -> [(following words, keyword id)]
+        keyword_ids: Dict[str, int] = {}
+        for domain, info in taxonomy.items():
+            for keyword in info.get("keywords", []):
+                words = self._TOKEN.findall(keyword.lower())
+                if not words:
+                    continue
+                key = " ".join(words)
+                if key not in keyword_ids:
+                    keyword_ids[key] = len(self._keyword_domains)
+                    self._keyword_domains.append([])
+                    if len(words) == 1:
+                        self._words.setdefault(words[0], []).append(keyword_ids[key])
+                    else:
+                        self._phrases.setdefault(words[0], []).append((tuple(words[1:]), keyword_ids[key]))
+                if domain not in self._keyword_domains[keyword_ids[key]]:
+                    self._keyword_domains[keyword_ids[key]].append(domain)
+        self._prefix_lengths = sorted({len(w) for w in self._words if len(w) >= self.PREFIX_MIN_LENGTH})
+    def _token_keywords(self, token: str) -> List[int]:
+        found = list(self._words.get(token, ()))
+        for length in self._prefix_lengths:
+            if length >= len(token):
+                break
+            found.extend(self._words.get(token[:length], ()))
+        return found
+    def scores(self, text: str) -> Dict[str, int]:
+        tokens = self._TOKEN.findall(text.lower())
+        unique = set(tokens)
+        found = set()
+        for token in unique:
+            found.update(self._token_keywords(token))
+        heads = unique.intersection(self._phrases)
+        if heads:
+            for index, token in enumerate(tokens):
+                if token in heads:
+                    for rest, keyword_id in self._phrases[token]:
+                        if tuple(tokens[index + 1:index + 1 + len(rest)]) == rest:
+                            found.add(keyword_id)
+        counts: Dict[str, int] = {}
+        for keyword_id in found:
+            for domain in self._keyword_domains[keyword_id]:
+                counts[domain] = counts.get(domain, 0) + 1
+        # Taxonomy order keeps max() tie-breaking stable
+        return {domain: counts[domain] for domain in self.domains if domain in counts}
+# (type, pattern, severity) - matched case-insensitively
+SECURITY_RULES = [
+    ("sql_injection", r"SELECT.*\+", "high"), ("sql_injection", r"INSERT.*\+", "high"),
+    ("sql_injection", r"DELETE.*\+", "high"), ("sql_injection", r"UPDATE.*\+", "high"),
+    ("sql_injection", r"execute\(\s*f[\"']", "high"),
+    ("xss", r"innerHTML", "medium"), ("xss", r"document\.write", "medium"), ("xss", r"eval\(", "high"),
+    ("command_injection", r"os\.system", "high"), ("command_injection", r"subprocess\.call", "medium"),
+    ("command_injection", r"exec\(", "high"), ("command_injection", r"shell\s*=\s*True", "high"),
+    ("hardcoded_secrets", r"password\s*=", "high"), ("hardcoded_secrets", r"api_key\s*=", "high"),
+    ("hardcoded_secrets", r"secret\s*=", "high"),
+    ("insecure_deserialization", r"pickle\.loads?\(", "high"), ("insecure_deserialization", r"yaml\.load\(", "medium"),
+    ("insecure_transport", r"verify\s*=\s*False", "medium"),
+]
+class SecurityRuleEngine:
+    """Precompiled security rules, matched against the lowered text (cheaper than IGNORECASE; the rules
+    only use lowercase escapes). A combined alternation rejects clean input in one pass, otherwise each
+    rule runs finditer once and matches are mapped to line numbers by bisect"""
+    def __init__(self, rules: List[tuple], max_findings_per_rule: int = 50):
+        self.max_findings_per_rule = max_findings_per_rule
+        self.rules = [(vuln_type, pattern, severity, re.compile(pattern.lower())) for vuln_type, pattern, severity in rules]
+        self.any_rule = re.compile("|".join(f"(?:{pattern.lower()})" for _, pattern, _ in rules))
+        # Fallback when lower() changes the text length (e.g. "İ") and offsets would drift
+        self.folded_rules = [(vuln_type, pattern, severity, re.compile(pattern, re.IGNORECASE)) for vuln_type, pattern, severity in rules]
+    def scan(self, code: str) -> List[Dict]:
+        lowered = code.lower()
+        if len(lowered) != len(code):
+            return self._scan(code, code, self.folded_rules)
+        if not self.any_rule.search(lowered):
+            return []
+        return self._scan(code, lowered, self.rules)
+    def _scan(self, code: str, haystack: str, rules: List[tuple]) -> List[Dict]:
+        line_starts = [0] + [match.end() for match in re.finditer("\n", code)]
+        findings = []
+        for vuln_type, pattern, severity, regex in rules:
+            for count, match in enumerate(regex.finditer(haystack)):
+                if count >= self.max_findings_per_rule:
+                    break
+                line = bisect.bisect_right(line_starts, match.start())
+                start = line_starts[line - 1]
+                end = code.find("\n", start)
+                findings.append({"type": vuln_type, "pattern": pattern, "severity": severity, "line": line,
+                                 "snippet": code[start:end if end != -1 else len(code)].strip()[:200]})
+        findings.sort(key=lambda finding: finding["line"])
+        return findings
+    @staticmethod
+    def summarize(findings: List[Dict]) -> Dict:
+        """Legacy shape: {vuln_type: [patterns]}"""
+        vulnerabilities: Dict[str, List[str]] = {}
+        for finding in findings:
+            patterns = vulnerabilities.setdefault(finding["type"], [])
+            if finding["pattern"] not in patterns:
+                patterns.append(finding["pattern"])
+        return vulnerabilities
 class SiliconBaapUtilities:
+    LANG_EMOJIS = {
+        "python": "🐍", "javascript": "📜", "java": "☕", "cpp": "⚡",
+        "html": "🌐", "css": "🎨", "php": "🐘", "ruby": "💎",
+        "go": "🔵", "rust": "🦀", "swift": "🐦", "kotlin": "🔶",
+        "typescript": "📘", "sql": "🗄️", "bash": "🐚",
+        "roman_urdu": "🇵🇰", "urdu": "🇵🇰"
+    }
     def __init__(self):
         self.language_patterns = {
             "python": [r"def\s+\w+\s*\(", r"import\s+\w+", r"from\s+\w+\s+import", r"class\s+\w+\s*:", r"print\s*\("],
@@ -694,179 +1635,1100 @@ class SiliconBaapUtilities:
             ],
             "urdu": [r"کیا", r"ہے", r"میں", r"تم", r"یہ", r"وہ", r"اچھا", r"ٹھیک"],
         }
+        self.language_detector = LanguageDetector(self.language_patterns)
+        self.domain_index = DomainIndex(load_domain_taxonomy(DOMAIN_TAXONOMY_PATH))
+        self.security_engine = SecurityRuleEngine(SECURITY_RULES)
     def detect_language_auto(self, text: str) -> str:
-        import re
-        scores = {}
-        for lang, patterns in self.language_patterns.items():
-            scores[lang] = sum(len(re.findall(p, text, re.IGNORECASE)) for p in patterns)
+        scores = self.language_detector.scores(text)
         best_lang = max(scores, key=scores.get) if scores and max(scores.values()) > 0 else "unknown"
-        lang_emojis = {
-            "python": "🐍", "javascript": "📜", "java": "☕", "cpp": "⚡",
-            "html": "🌐", "css": "🎨", "php": "🐘", "ruby": "💎",
-            "go": "🔵", "rust": "🦀", "swift": "🐦", "kotlin": "🔶",
-            "typescript": "📘", "sql": "🗄️", "bash": "🐚",
-            "roman_urdu": "🇵🇰", "urdu": "🇵🇰"
-        }
         if best_lang != "unknown":
-            return f"{lang_emojis.get(best_lang, '🔍')} {best_lang}"
+            return f"{self.LANG_EMOJIS.get(best_lang, '🔍')} {best_lang}"
         return "❓ unknown"
     def detect_domain_auto(self, text: str) -> str:
-        domain_keywords = {
-            # Technology Domains
-            "ai_ml_research": ["neural", "network", "machine learning", "deep learning", "ai", "artificial intelligence", "tensorflow", "pytorch", "nlp", "computer vision"],
-            "quantum_computing": ["quantum", "qubit", "superposition", "entanglement", "quantum computer", "quantum algorithm"],
-            "blockchain_web3": ["blockchain", "crypto", "web3", "nft", "defi", "bitcoin", "ethereum", "smart contract", "dapp"],
-            "cybersecurity": ["security", "hack", "encryption", "firewall", "malware", "virus", "cyber attack", "penetration testing"],
-            "web_development": ["website", "web", "html", "css", "javascript", "react", "vue", "angular", "frontend", "backend"],
-            "data_science": ["data", "analysis", "pandas", "numpy", "visualization", "dataset", "big data", "analytics"],
-            "cloud_computing": ["aws", "azure", "google cloud", "cloud", "serverless", "kubernetes", "docker"],
-            "devops": ["ci/cd", "jenkins", "gitlab", "ansible", "terraform", "infrastructure"],
-  
-            # Business Domains
-            "startup_business": ["startup", "business", "venture", "funding", "investor", "pitch", "entrepreneur"],
-            "marketing_sales": ["marketing", "sales", "customer", "conversion", "seo", "social media", "advertising"],
-            "finance_economics": ["finance", "economic", "stock", "investment", "trading", "banking", "crypto"],
-            "healthcare_medical": ["medical", "health", "patient", "hospital", "doctor", "treatment", "medicine"],
-            "education_learning": ["education", "learning", "student", "teacher", "course", "online learning", "tutorial"],
-  
-            # Creative Domains
-            "content_creation": ["content", "blog", "article", "writing", "copywriting", "social media"],
-            "design_creative": ["design", "creative", "ui/ux", "graphic", "logo", "branding", "illustration"],
-            "music_audio": ["music", "audio", "song", "sound", "recording", "production"],
-            "video_production": ["video", "film", "editing", "animation", "youtube", "content creation"],
-  
-            # Scientific Domains
-            "scientific_research": ["research", "scientific", "experiment", "lab", "theory", "hypothesis"],
-            "engineering_tech": ["engineering", "technical", "mechanical", "electrical", "civil", "software"],
-            "mathematics": ["math", "calculus", "algebra", "equation", "formula", "statistics"],
-            "physics": ["physics", "quantum", "relativity", "energy", "force", "motion"],
-  
-            # Lifestyle Domains
-            "cooking_food": ["cooking", "recipe", "food", "cuisine", "ingredient", "cook"],
-            "travel_tourism": ["travel", "tour", "vacation", "destination", "hotel", "flight"],
-            "fitness_health": ["fitness", "exercise", "workout", "health", "nutrition", "diet"],
-            "gaming_entertainment": ["game", "gaming", "player", "entertainment", "streaming", "esports"],
-        }
-        domain_scores = {}
-        for domain, keywords in domain_keywords.items():
-            score = sum(1 for keyword in keywords if keyword.lower() in text.lower())
-            if score > 0:
-                domain_scores[domain] = score
+        domain_scores = self.domain_index.scores(text)
         if domain_scores:
             best_domain = max(domain_scores, key=domain_scores.get)
-            domain_emojis = {
-                "ai_ml_research": "🤖", "quantum_computing": "⚛️", "blockchain_web3": "⛓️",
-                "cybersecurity": "🔒", "web_development": "🌐", "data_science": "📊",
-                "cloud_computing": "☁️", "devops": "🔄", "startup_business": "🚀",
-                "marketing_sales": "📢", "finance_economics": "💰", "healthcare_medical": "🏥",
-                "education_learning": "🎓", "content_creation": "✍️", "design_creative": "🎨",
-                "music_audio": "🎵", "video_production": "🎥", "scientific_research": "🔬",
-                "engineering_tech": "⚙️", "mathematics": "🧮", "physics": "🌌",
-                "cooking_food": "👨‍🍳", "travel_tourism": "✈️", "fitness_health": "💪",
-                "gaming_entertainment": "🎮"
-            }
-            return f"{domain_emojis.get(best_domain, '🎯')} {best_domain.replace('_', ' ').title()}"
+            return f"{self.domain_index.emojis.get(best_domain, '🎯')} {best_domain.replace('_', ' ').title()}"
         return "🌐 general"
     def read_file_content(self, file_path: str, file_type: str) -> str:
+        try:
+            if file_type == "zip":
+                return self.extract_zip_content(file_path)
+            return _extract_document(file_path, file_type)
+        except Exception as e:
+            return f"Error reading file: {str(e)}"
+    def extract_zip_content(self, zip_path: str, max_chars: int = ZIP_MAX_TEXT_CHARS) -> str:
+        """Archive text up to max_chars - the generator is closed there, so later members are never inflated"""
+        parts: List[str] = []
+        size = 0
+        chunks = iter_zip_content(zip_path)
+        try:
+            for chunk in chunks:
+                if size + len(chunk) > max_chars:
+                    parts.append(chunk[:max_chars - size])
+                    parts.append(f"\n⚠️ Truncated: archive text exceeds {max_chars} characters\n")
+                    break
+                parts.append(chunk)
+                size += len(chunk)
+        except Exception as e:
+            parts.append(f"ZIP extraction failed: {str(e)}")
+        finally:
+            chunks.close()
+        return "".join(parts)
+    def analyze_security(self, code: str) -> Dict:
+        return self.security_engine.summarize(self.security_engine.scan(code))
+utils = SiliconBaapUtilities()
+# ====================== TOKEN BUDGET 🧮 ======================
+class TokenEstimator:
+    """tiktoken's cl100k_base when installed (close enough to the Llama/Qwen vocabularies for budgeting),
+    otherwise a conservative heuristic: one token per 4 UTF-8 bytes of each word piece, one per symbol"""
+    PIECE = re.compile(r"\w+|[^\w\s]")
+    def __init__(self, mode: str = TOKENIZER):
+        self.mode = mode
+        self._encoding = None
+        self._loaded = mode == "heuristic"
+    @property
+    def encoding(self):
+        if not self._loaded:  # lazy - the vocab may need a download on first use
+            self._loaded = True
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.info(f"tiktoken unavailable ({e.__class__.__name__}) - using heuristic token estimates")
+        return self._encoding
+    @property
+    def backend(self) -> str:
+        return "tiktoken" if self.encoding is not None else "heuristic"
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return sum((len(piece.encode("utf-8")) + 3) // 4 for piece in self.PIECE.findall(text))
+    def estimate(self, text: str, sample_chars: int = TOKEN_SAMPLE_CHARS) -> int:
+        """Exact for short text; longer text is extrapolated from four evenly spaced windows,
+        so whole-document size checks cost O(sample_chars) however large the document is"""
+        if len(text) <= sample_chars:
+            return self.count(text)
+        window = sample_chars // 4
+        step = len(text) // 4
+        sampled = sum(self.count(text[i * step:i * step + window]) for i in range(4))
+        return int(sampled * len(text) / (4 * window)) + 1
+    def count_messages(self, messages: List[Dict]) -> int:
+        return sum(self.count(message["content"]) + 4 for message in messages) + 3  # role/framing overhead
+token_estimator = TokenEstimator()
+def estimate_tokens(text: str) -> int:
+    return token_estimator.estimate(text)
+def _trim_text(text: str, budget: int) -> str:
+    """Keep the head and tail of text within budget tokens, marking the cut"""
+    total = token_estimator.estimate(text)
+    keep = int(len(text) * budget / max(total, 1))
+    for _ in range(6):
+        head = text[:keep * 2 // 3]
+        tail = text[len(text) - keep // 3:] if keep >= 3 else ""
+        trimmed = f"{head}\n\n[... input trimmed to fit the model context ...]\n\n{tail}"
+        if token_estimator.count(trimmed) <= budget:
+            return trimmed
+        keep = int(keep * 0.85)
+    return text[:max(0, budget)]
+def budget_request(messages: List[Dict], model: str) -> tuple:
+    """Fit messages to the model context. Returns (messages, max_tokens, prompt_tokens): max_tokens shrinks
+    to what's left of the window, and an oversized user message is trimmed (or rejected with 413)"""
+    context = SILICON_BAAP_MODELS.get(model, {}).get("context", 8192)
+    limit = int(context * (1 - CONTEXT_SAFETY_MARGIN))
+    prompt_tokens = token_estimator.count_messages(messages)
+    if limit - prompt_tokens < MIN_COMPLETION_TOKENS:
+        if CONTEXT_OVERFLOW == "reject":
+            raise HTTPException(status_code=413, detail=f"Input is ~{prompt_tokens} tokens; {model} accepts about {limit - MIN_COMPLETION_TOKENS}")
+        user = messages[-1]["content"]
+        fixed = prompt_tokens - token_estimator.count(user)
+        trimmed = _trim_text(user, limit - min(MAX_COMPLETION_TOKENS, limit // 4) - fixed)
+        logger.warning(f"🧮 Trimmed ~{prompt_tokens} token prompt to fit {model} ({context} context)")
+        messages = messages[:-1] + [{**messages[-1], "content": trimmed}]
+        prompt_tokens = token_estimator.count_messages(messages)
+    max_tokens = max(MIN_COMPLETION_TOKENS, min(MAX_COMPLETION_TOKENS, limit - prompt_tokens))
+    return messages, max_tokens, prompt_tokens
+async def fit_to_context(messages: List[Dict], model: str) -> tuple:
+    """budget_request, moved off the event loop once the prompt is big enough for counting to stall it"""
+    if sum(len(message["content"]) for message in messages) <= TOKEN_SAMPLE_CHARS:
+        return budget_request(messages, model)
+    return await asyncio.to_thread(budget_request, messages, model)
+async def record_usage(feature: str, model: str, usage: Dict, session_id: Optional[str]):
+    """Real token usage from Groq, batched into usage_stats through the write-behind queue"""
+    if usage:
+        await log_row("INSERT INTO usage_stats (feature, model_used, tokens_used, prompt_tokens, completion_tokens, session_id) VALUES (?, ?, ?, ?, ?, ?)",
+                      (feature, model, usage.get("total_tokens"), usage.get("prompt_tokens"), usage.get("completion_tokens"), session_id))
+# ====================== SUMMARIZATION 🧩 ======================
+PROMPT_OVERHEAD_TOKENS = 512  # system prompt + feature template around the chunk
+def chunk_token_budget(model: str) -> int:
+    context = SILICON_BAAP_MODELS.get(model, {}).get("context", 8192)
+    return max(256, min(SUMMARY_CHUNK_TOKENS, context - GROQ_SAMPLING["max_tokens"] - PROMPT_OVERHEAD_TOKENS))
+LINE = re.compile(r"[^\n]*\n|[^\n]+")
+def _token_units(text: str, max_tokens: int):
+    """(piece, tokens) pairs that each fit max_tokens: whole lines, else words, else hard slices of one word.
+    Lazy, so a caller that stops early never scans the rest of the text"""
+    for line in (match.group() for match in LINE.finditer(text)):
+        tokens = token_estimator.count(line)
+        if tokens <= max_tokens:
+            yield line, tokens
+            continue
+        for word in re.findall(r"\S+\s*|\s+", line):
+            tokens = token_estimator.count(word)
+            if tokens <= max_tokens:
+                yield word, tokens
+                continue
+            step = max(1, len(word) * max_tokens // tokens)
+            start = 0
+            while start < len(word):
+                cut = step
+                part = word[start:start + cut]
+                tokens = token_estimator.count(part)
+                while tokens > max_tokens and cut > 1:
+                    cut //= 2
+                    part = word[start:start + cut]
+                    tokens = token_estimator.count(part)
+                yield part, tokens
+                start += cut
+def split_into_chunks(text: str, max_tokens: int, max_chunks: Optional[int] = None) -> List[str]:
+    """Greedy packing of whole lines (hard-split only when one line is too long) so every chunk fits max_tokens,
+    measured with the same token_estimator the request budget uses. Stops after max_chunks chunks."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    def flush():
+        chunk = "".join(current)
+        if chunk.strip():
+            chunks.append(chunk)
+    for piece, tokens in _token_units(text, max_tokens):
+        if size + tokens > max_tokens and current:
+            flush()
+            current, size = [], 0
+            if max_chunks is not None and len(chunks) >= max_chunks:
+                return chunks
+        current.append(piece)
+        size += tokens
+    flush()
+    return chunks
+# ====================== HTTP CLIENT POOL 🔌 ======================
+class HTTPClientPool:
+    """App-scoped httpx client with keep-alive, HTTP/2 and connection reuse counters"""
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+        self.counters = {"requests": 0, "new_connections": 0, "errors": 0}
+    def _build_client(self) -> httpx.AsyncClient:
+        self.http2 = HTTP2_ENABLED
+        if self.http2:
+            try:
+                import h2  # noqa: F401 - httpx needs it for http2=True
+            except ImportError:
+                logger.warning("h2 not installed - HTTP/2 disabled, using HTTP/1.1 keep-alive.")
+                self.http2 = False
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT,
+                                  write=HTTP_WRITE_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+        )
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Lazily created so the pool also works when the app runs without its lifespan (scripts, tests)
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+    async def start(self):
+        _ = self.client
+        logger.info(f"✅ HTTP pool ready (http2={self.http2}, max_connections={HTTP_MAX_CONNECTIONS}, keepalive={HTTP_MAX_KEEPALIVE})")
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+    async def _trace(self, event_name: str, info: Dict):
+        # httpcore emits connect_tcp only when a brand-new connection is opened
+        if event_name == "connection.connect_tcp.complete":
+            self.counters["new_connections"] += 1
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        self.counters["requests"] += 1
+        extensions = kwargs.pop("extensions", None) or {}
+        extensions["trace"] = self._trace
+        try:
+            return await self.client.request(method, url, extensions=extensions, **kwargs)
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+    def stream(self, method: str, url: str, **kwargs):
+        """Streaming variant of request() - use as `async with http_pool.stream(...) as response`"""
+        self.counters["requests"] += 1
+        extensions = kwargs.pop("extensions", None) or {}
+        extensions["trace"] = self._trace
+        return self.client.stream(method, url, extensions=extensions, **kwargs)
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+    async def get_text(self, url: str, max_bytes: int, **kwargs) -> tuple:
+        """GET reading at most max_bytes of the body; returns (text, truncated)"""
+        body = bytearray()
+        truncated = False
+        async with self.stream("GET", url, **kwargs) as response:
+            async for chunk in response.aiter_bytes():
+                body += chunk[:max_bytes - len(body)]
+                if len(body) >= max_bytes:
+                    truncated = True
+                    break
+            return body.decode(response.encoding or "utf-8", errors="replace"), truncated
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "reused_connections": max(self.counters["requests"] - self.counters["new_connections"] - self.counters["errors"], 0),
+            "http2": self.http2,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE,
+        }
+http_pool = HTTPClientPool()
+# ====================== COMPLETION CACHE 🧊 ======================
+class MemoryCacheTier:
+    """In-process LRU tier with TTL, an entry bound and an optional bound on total string characters"""
+    name = "memory"
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS, max_chars: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.chars = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+    @staticmethod
+    def _size(value: Any) -> int:
+        return len(value) if isinstance(value, str) else 0
+    def _drop(self, key: str):
+        self.chars -= self._size(self._data.pop(key)[1])
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+    async def set(self, key: str, value: Any):
+        if key in self._data:
+            self._drop(key)
+        if self.max_chars is not None and self._size(value) > self.max_chars:
+            return  # would evict everything else and still not fit
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self.chars += self._size(value)
+        while len(self._data) > self.max_entries or (self.max_chars is not None and self.chars > self.max_chars):
+            self._drop(next(iter(self._data)))
+    def __len__(self) -> int:
+        return len(self._data)
+    async def size(self) -> int:
+        return len(self._data)
+class SQLiteCacheTier:
+    """Persistent tier - survives restarts, evicts least recently used rows past max_entries"""
+    name = "sqlite"
+    def __init__(self, path: str, max_entries: int = CACHE_SQLITE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db = Database(path, pool_size=2, setup=self._create_table)
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute('''CREATE TABLE IF NOT EXISTS completion_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            expires_at REAL,
+            last_access REAL
+        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completion_cache_access ON completion_cache(last_access)")
+        conn.commit()
+    async def get(self, key: str) -> Optional[Any]:
+        def op(conn):
+            now = time.time()
+            row = conn.execute("SELECT value, expires_at FROM completion_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row["expires_at"] < now:
+                conn.execute("DELETE FROM completion_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE completion_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row["value"])
+        return await self.db.run(op)
+    async def set(self, key: str, value: Any):
+        def op(conn):
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO completion_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), now + self.ttl, now))
+            conn.execute('''DELETE FROM completion_cache WHERE key IN (
+                SELECT key FROM completion_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)''', (self.max_entries,))
+            conn.commit()
+        await self.db.run(op)
+    async def size(self) -> int:
+        return await self.db.run(lambda conn: conn.execute("SELECT COUNT(*) FROM completion_cache").fetchone()[0])
+class CompletionCache:
+    """Tiered completion cache keyed on a hash of (messages, model, sampling params)"""
+    def __init__(self, tiers: List[Any], disabled_features: Optional[set] = None):
+        self.tiers = tiers
+        self.disabled_features = disabled_features or set()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, **{f"{tier.name}_hits": 0 for tier in tiers}}
+        self.feature_counters: Dict[str, Dict[str, int]] = {}
+    @staticmethod
+    def make_key(messages: List[Dict], model: str, params: Dict) -> str:
+        raw = json.dumps({"messages": messages, "model": model, "params": params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    def enabled_for(self, feature: str, feature_info: Dict) -> bool:
+        return bool(self.tiers) and feature not in self.disabled_features and feature_info.get("cache", True)
+    def _count(self, feature: str, outcome: str):
+        self.counters[outcome] += 1
+        per_feature = self.feature_counters.setdefault(feature, {"hits": 0, "misses": 0})
+        per_feature[outcome] += 1
+    async def get(self, key: str, feature: str = "") -> Optional[Dict]:
+        for index, tier in enumerate(self.tiers):
+            try:
+                value = await tier.get(key)
+            except Exception as e:
+                logger.warning(f"Cache tier {tier.name} read failed: {e}")
+                continue
+            if value is not None:
+                self.counters[f"{tier.name}_hits"] += 1
+                self._count(feature, "hits")
+                for upper in self.tiers[:index]:  # promote into faster tiers
+                    await upper.set(key, value)
+                return value
+        self._count(feature, "misses")
+        return None
+    async def set(self, key: str, value: Dict):
+        self.counters["stores"] += 1
+        for tier in self.tiers:
+            try:
+                await tier.set(key, value)
+            except Exception as e:
+                logger.warning(f"Cache tier {tier.name} write failed: {e}")
+    async def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": {tier.name: await tier.size() for tier in self.tiers},
+            "disabled_features": sorted(self.disabled_features),
+            "by_feature": self.feature_counters,
+        }
+def build_completion_cache() -> CompletionCache:
+    tiers = []
+    if CACHE_ENABLED:
+        tiers.append(MemoryCacheTier())
+        if CACHE_SQLITE_PATH or SHARED_STATE_PATH:  # the memory tier is per worker; this one is shared
+            tiers.append(SQLiteCacheTier(CACHE_SQLITE_PATH or SHARED_STATE_PATH))
+    return CompletionCache(tiers, CACHE_DISABLED_FEATURES)
+completion_cache = build_completion_cache()
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight task. Callers await it shielded, so one
+    caller disconnecting doesn't cancel the call for the others"""
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+    async def do(self, key: str, fn) -> tuple:
+        """Returns (result, shared) - shared is True when this caller joined an existing call"""
+        if not self.enabled:
+            return await fn(), False
+        task = self.calls.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.calls.pop(key) if self.calls.get(key) is done else None)
+            self.leaders += 1
+        return await asyncio.shield(task), shared
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, "in_flight": len(self.calls), "leaders": self.leaders, "coalesced": self.followers}
+completion_flights = SingleFlight()
+# ====================== INPUT ANALYSIS 🔎 ======================
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+def close_analysis_executor():
+    """Shut the pool down and leave a fresh one behind, like Database.close(), so the app can start again"""
+    global analysis_executor
+    analysis_executor.shutdown(wait=False)
+    analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+analysis_cache = MemoryCacheTier(ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TTL)
+def _analyze_text(text: str) -> Dict:
+    return {"detected_language": utils.detect_language_auto(text), "detected_domain": utils.detect_domain_auto(text)}
+async def analyze_input(text: str) -> Dict:
+    """Language + domain detection on the analysis pool, memoised by input hash"""
+    key = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+    cached = await analysis_cache.get(key)
+    if cached is not None:
+        return cached
+    result = await asyncio.get_running_loop().run_in_executor(analysis_executor, _analyze_text, text)
+    await analysis_cache.set(key, result)
+    return result
+def start_analysis(text: str, enabled: bool = True) -> Optional[asyncio.Future]:
+    return asyncio.ensure_future(analyze_input(text)) if enabled else None
+async def finish_analysis(task: Optional[asyncio.Future]) -> Dict:
+    if task is None:
+        return {"detected_language": None, "detected_domain": None}
+    return await task
+# ====================== EXTRACTION ENGINE 📑 ======================
+class DocumentExtractor:
+    """Runs document parsing in a process pool. PDFs are split into page ranges parsed in parallel,
+    and results are cached by content hash so re-uploading the same document is free."""
+    def __init__(self, workers: int = EXTRACT_WORKERS, pages_per_task: int = EXTRACT_PDF_PAGES_PER_TASK):
+        self.workers = workers
+        self.pages_per_task = max(1, pages_per_task)
+        self.cache = MemoryCacheTier(EXTRACT_CACHE_SIZE, EXTRACT_CACHE_TTL, EXTRACT_CACHE_MAX_CHARS)
+        self._pool = None  # ProcessPoolExecutor, created on first extraction
+        self.counters = {"extractions": 0, "cache_hits": 0, "pdf_tasks": 0, "errors": 0}
+    def _executor(self):
+        if self.workers <= 0:
+            return None  # default thread pool - still off the event loop
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: forking a process that already runs threads and an event loop is not safe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+    async def extract(self, file_path: str, file_type: str) -> str:
+        path = Path(file_path)
+        if SHA256_NAME.fullmatch(path.stem) and path.parent.resolve() == Path(UPLOAD_DIR).resolve():
+            digest = path.stem  # saved uploads are content-addressed - save_upload_stream already hashed them
+        else:
+            try:
+                digest = await asyncio.to_thread(_file_sha256, file_path)
+            except OSError as e:
+                return f"Error reading file: {str(e)}"
+        key = f"{digest}:{file_type}"
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.counters["cache_hits"] += 1
+            return cached
+        self.counters["extractions"] += 1
         try:
             if file_type == "pdf":
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    return " ".join(page.extract_text() for page in reader.pages if page.extract_text())
-            elif file_type == "txt":
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            elif file_type == "docx":
-                doc = Document(file_path)
-                return " ".join(paragraph.text for paragraph in doc.paragraphs)
-            elif file_type == "csv":
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    reader = csv.reader(f)
-                    return " ".join([", ".join(row) for row in reader])
+                text = await self._extract_pdf(file_path)
             elif file_type == "zip":
-                return self.extract_zip_content(file_path)
+                text = await asyncio.to_thread(utils.extract_zip_content, file_path)
             else:
-                return f"Unsupported file type: {file_type}"
+                text = await self._run(_extract_document, file_path, file_type)
         except Exception as e:
+            self.counters["errors"] += 1
             return f"Error reading file: {str(e)}"
-    def extract_zip_content(self, zip_path: str) -> str:
+        await self.cache.set(key, text)
+        return text
+    async def _extract_pdf(self, file_path: str) -> str:
+        page_count = await self._run(_pdf_page_count, file_path)
+        ranges = [(start, min(start + self.pages_per_task, page_count)) for start in range(0, page_count, self.pages_per_task)]
+        self.counters["pdf_tasks"] += len(ranges)
+        parts = await asyncio.gather(*(self._run(_extract_pdf_pages, file_path, start, end) for start, end in ranges))
+        return " ".join(part for part in parts if part)
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    def stats(self) -> Dict:
+        return {**self.counters, "workers": self.workers, "cached_documents": len(self.cache), "cached_chars": self.cache.chars}
+document_extractor = DocumentExtractor()
+# ====================== GROQ SCHEDULER ⏱️ ======================
+# Fairness lane for upstream calls; nested calls (map-reduce chunks, composite features) inherit it
+groq_lane: ContextVar[str] = ContextVar("groq_lane", default="anonymous")
+class GroqQueueFull(Exception):
+    pass
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (requests larger than the bucket wait for a full bucket)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+    def give(self, amount: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+    def sync(self, remaining: float):
+        if self.capacity > 0:
+            self.level = min(self.level, remaining)
+class ModelScheduler:
+    """Admission control for one model. Waiters queue per lane (session) and are granted round-robin
+    when the request and token buckets allow it and in-flight calls are under the adaptive limit
+    (halved on 429, grown by 1/limit per success). A 429 retry-after pauses the whole model.
+    With `shared` set the rate budget and pauses live in SharedState and are drawn on by every worker."""
+    def __init__(self, model: str, rpm: int, tpm: int, max_concurrency: int = GROQ_MAX_CONCURRENCY, max_queue: int = GROQ_QUEUE_MAX,
+                 shared: Optional[SharedState] = None):
+        self.model = model
+        self.shared = shared
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_queue = max_queue
+        self.lanes: "OrderedDict[str, deque]" = OrderedDict()
+        self.queued = 0
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.waits = deque(maxlen=512)
+        self.admitted = self.rejected = self.timeouts = self.rate_limited = 0
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+    async def acquire(self, lane: str, tokens: int, timeout: float = GROQ_QUEUE_TIMEOUT) -> Dict:
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise GroqQueueFull(f"{self.model} queue is full ({self.max_queue})")
+        waiter = asyncio.get_running_loop().create_future()
+        self.lanes.setdefault(lane, deque()).append((waiter, tokens, time.monotonic()))
+        self.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
         try:
-            content = []
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for file_info in zip_ref.infolist():
-                    if not file_info.is_dir():
-                        content.append(f"📁 File: {file_info.filename}")
-                        try:
-                            with zip_ref.open(file_info) as file:
-                                if file_info.filename.endswith('.txt'):
-                                    content.append(file.read().decode('utf-8'))
-                        except Exception as e:
-                            content.append(f"❌ Error reading {file_info.filename}: {str(e)}")
-            return "\n".join(content)
+            return await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release(waiter.result())  # granted as we gave up
+            else:
+                self.queued -= 1
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+            raise
+    def _head(self):
+        for lane in list(self.lanes):
+            waiters = self.lanes[lane]
+            while waiters and waiters[0][0].done():  # abandoned
+                waiters.popleft()
+            if waiters:
+                return lane, waiters[0]
+            del self.lanes[lane]
+        return None, None
+    async def _dispatch(self):
+        while True:
+            lane, head = self._head()
+            if head is None:
+                return
+            waiter, tokens, enqueued = head
+            now = time.monotonic()
+            delay: Optional[float] = None  # until a release
+            if self.in_flight < max(1, int(self.concurrency_limit)):
+                delay = await self._admit(tokens, now)
+                if delay <= 0 and waiter.done():  # abandoned while the shared budget was consulted
+                    self._settle(requests_back=1, tokens_back=tokens)
+                    continue
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            waiters = self.lanes[lane]
+            waiters.popleft()
+            if waiters:
+                self.lanes.move_to_end(lane)  # round-robin across sessions
+            else:
+                del self.lanes[lane]
+            self.queued -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            self.waits.append(now - enqueued)
+            waiter.set_result({"tokens": tokens, "status": None, "retry_after": None, "used_tokens": None, "remaining_tokens": None})
+    async def _admit(self, tokens: int, now: float) -> float:
+        """0.0 once the call is charged against the rate budget, otherwise seconds to wait"""
+        local_pause = self.blocked_until - now
+        if self.shared is not None and local_pause <= 0:
+            try:
+                return await self.shared.admit(self.model, self.requests.capacity, self.tokens.capacity, tokens)
+            except Exception as e:
+                logger.warning(f"Shared rate budget unavailable for {self.model}, using the local one: {e}")
+        delay = max(local_pause, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+        if delay <= 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        return delay
+    def _settle(self, requests_back: int = 0, tokens_back: int = 0, remaining_tokens: Optional[int] = None, pause: Optional[float] = None):
+        self.requests.give(requests_back)
+        self.tokens.give(tokens_back)
+        if remaining_tokens is not None:
+            self.tokens.sync(remaining_tokens)
+        if self.shared is not None and (requests_back or tokens_back or remaining_tokens is not None or pause):
+            spawn_background(self._settle_shared(requests_back, tokens_back, remaining_tokens, pause))
+    async def _settle_shared(self, *args):
+        try:
+            await self.shared.settle(self.model, self.requests.capacity, self.tokens.capacity, *args)
         except Exception as e:
-            return f"ZIP extraction failed: {str(e)}"
-    def analyze_security(self, code: str) -> Dict:
-        security_patterns = {
-            "sql_injection": [r"SELECT.*\+", r"INSERT.*\+", r"DELETE.*\+", r"UPDATE.*\+"],
-            "xss": [r"innerHTML", r"document\.write", r"eval\("],
-            "command_injection": [r"os\.system", r"subprocess\.call", r"exec\("],
-            "hardcoded_secrets": [r"password\s*=", r"api_key\s*=", r"secret\s*="],
+            logger.warning(f"Shared rate budget update for {self.model} failed: {e}")
+    def release(self, permit: Dict):
+        self.in_flight -= 1
+        status = permit["status"]
+        pause = None
+        if status == 429:
+            self.rate_limited += 1
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            pause = permit["retry_after"] or GROQ_RETRY_BASE_DELAY
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        elif status is not None and status < 400:
+            self.concurrency_limit = min(float(self.max_concurrency), self.concurrency_limit + 1 / self.concurrency_limit)
+        # refund the max_tokens reservation
+        refund = max(0, permit["tokens"] - permit["used_tokens"]) if permit["used_tokens"] is not None else 0
+        self._settle(tokens_back=refund, remaining_tokens=permit["remaining_tokens"], pause=pause)
+        self._wakeup.set()
+    def stats(self) -> Dict:
+        waits = sorted(self.waits)
+        return {
+            "queue_depth": self.queued,
+            "lanes": len(self.lanes),
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "rate_limited": self.rate_limited,
+            "paused_for_s": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            "wait_avg_ms": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+            "wait_p95_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 2) if waits else 0.0,
+            "wait_max_ms": round(1000 * waits[-1], 2) if waits else 0.0,
         }
-        vulnerabilities = {}
-        for vuln_type, patterns in security_patterns.items():
-            found = []
-            for pattern in patterns:
-                if re.search(pattern, code, re.IGNORECASE):
-                    found.append(pattern)
-            if found:
-                vulnerabilities[vuln_type] = found
-        return vulnerabilities
-utils = SiliconBaapUtilities()
+class GroqScheduler:
+    def __init__(self, limits: Dict[str, Dict], shared: Optional[SharedState] = None):
+        self.limits = limits
+        self.shared = shared
+        self.models: Dict[str, ModelScheduler] = {}
+        self.retries = 0
+    def for_model(self, model: str) -> ModelScheduler:
+        scheduler = self.models.get(model)
+        if scheduler is None:
+            limits = self.limits.get(model, {})
+            scheduler = ModelScheduler(model, limits.get("rpm", GROQ_DEFAULT_RPM), limits.get("tpm", GROQ_DEFAULT_TPM), shared=self.shared)
+            self.models[model] = scheduler
+        return scheduler
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int, lane: Optional[str] = None):
+        scheduler = self.for_model(model)
+        permit = await scheduler.acquire(lane or groq_lane.get(), tokens)
+        try:
+            yield permit
+        finally:
+            scheduler.release(permit)
+    def stats(self) -> Dict:
+        return {"retries": self.retries, "shared_budget": self.shared is not None,
+                "models": {model: scheduler.stats() for model, scheduler in self.models.items()}}
+groq_scheduler = GroqScheduler(GROQ_RATE_LIMITS, shared_state)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+def _retry_after_seconds(headers) -> Optional[float]:
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+def _record_response(permit: Dict, response: httpx.Response):
+    permit["status"] = response.status_code
+    permit["retry_after"] = _retry_after_seconds(response.headers)
+    remaining = response.headers.get("x-ratelimit-remaining-tokens")
+    if remaining and remaining.isdigit():
+        permit["remaining_tokens"] = int(remaining)
+def _retry_delay(attempt: int, status: Optional[int], retry_after: Optional[float]) -> Optional[float]:
+    """Seconds to back off before the next attempt, or None to give up.
+    After a 429 the scheduler itself holds the model until retry-after, so only jitter is added here."""
+    if attempt >= GROQ_MAX_RETRIES or (status is not None and status not in RETRYABLE_STATUS):
+        return None
+    if retry_after is not None:
+        return None if retry_after > GROQ_QUEUE_TIMEOUT else random.uniform(0, GROQ_RETRY_BASE_DELAY)
+    return random.uniform(0, min(GROQ_RETRY_MAX_DELAY, GROQ_RETRY_BASE_DELAY * 2 ** attempt))  # full jitter
+# ====================== MODEL ROUTER 🧭 ======================
+# Preferred model types per feature category; short prompts jump straight to the instant tier
+ROUTE_PREFERENCES = {
+    "code": ("ultimate", "reasoning", "efficient", "instant"),
+    "security": ("reasoning", "ultimate", "efficient", "instant"),
+    "data": ("reasoning", "ultimate", "efficient", "instant"),
+    "science": ("reasoning", "ultimate", "efficient", "instant"),
+    "default": ("ultimate", "efficient", "reasoning", "instant"),
+}
+COMPOSITE_FEATURES = ("web_scraper", "file_reader", "zip_extractor", "security_scanner")
+class ModelRouter:
+    """Orders candidate models for a request: category preference (or instant first for short prompts),
+    models whose context can't hold the prompt dropped, and slow/failing models (EWMA) moved to the back"""
+    def __init__(self, models: Dict[str, Dict]):
+        self.models = models
+        self.health = {model: {"latency_ms": None, "error_rate": 0.0, "last_seen": 0.0, "calls": 0} for model in models}
+        self.decisions: Counter = Counter()
+        self.reasons: Counter = Counter()
+        self.failovers = 0
+    def healthy(self, model: str) -> bool:
+        health = self.health[model]
+        if time.monotonic() - health["last_seen"] > ROUTER_RECOVERY_SECONDS:
+            return True
+        slow = health["latency_ms"] is not None and health["latency_ms"] > ROUTER_SLOW_MS
+        return not slow and health["error_rate"] <= ROUTER_MAX_ERROR_RATE
+    def route(self, feature: str, feature_info: Dict, input_data: str) -> tuple:
+        """Returns (ordered candidate models, reason)"""
+        category = feature_info.get("category", "default")
+        short = feature not in COMPOSITE_FEATURES and len(input_data) <= ROUTER_SHORT_PROMPT_CHARS
+        preference = ROUTE_PREFERENCES.get(category, ROUTE_PREFERENCES["default"])
+        if short:
+            preference = ("instant",) + tuple(t for t in preference if t != "instant")
+        needed = estimate_tokens(input_data) + GROQ_SAMPLING["max_tokens"] + PROMPT_OVERHEAD_TOKENS
+        models = [m for m in self.models if self.models[m]["context"] >= needed] or list(self.models)
+        rank = {model_type: index for index, model_type in enumerate(preference)}
+        models.sort(key=lambda m: (not self.healthy(m), rank.get(self.models[m]["type"], len(rank))))
+        reason = f"{'short' if short else 'long'}:{category}"
+        if not self.healthy(models[0]):
+            reason += ":all-degraded"
+        elif rank.get(self.models[models[0]]["type"]) != 0:
+            reason += ":failover-preferred-degraded"
+        self.decisions[models[0]] += 1
+        self.reasons[reason] += 1
+        logger.info(f"🧭 Route {feature} ({len(input_data)} chars, {reason}) -> {models[0]}")
+        return models, reason
+    def observe(self, model: str, latency: float, ok: bool):
+        health = self.health.get(model)
+        if health is None:
+            return
+        alpha = ROUTER_EWMA_ALPHA
+        if ok:
+            latency_ms = latency * 1000
+            health["latency_ms"] = latency_ms if health["latency_ms"] is None else (1 - alpha) * health["latency_ms"] + alpha * latency_ms
+        health["error_rate"] = (1 - alpha) * health["error_rate"] + alpha * (0.0 if ok else 1.0)
+        health["last_seen"] = time.monotonic()
+        health["calls"] += 1
+    def stats(self) -> Dict:
+        return {
+            "decisions": dict(self.decisions),
+            "reasons": dict(self.reasons),
+            "failovers": self.failovers,
+            "models": {model: {"healthy": self.healthy(model), "calls": h["calls"], "error_rate": round(h["error_rate"], 3),
+                               "latency_ms": round(h["latency_ms"], 1) if h["latency_ms"] is not None else None}
+                       for model, h in self.health.items()},
+        }
+model_router = ModelRouter(SILICON_BAAP_MODELS)
+# ====================== HEDGING 🪁 ======================
+class Hedger:
+    """Launches a backup attempt when the primary hasn't finished (or streamed its first token) within the
+    recent latency percentile for its model; the first usable result wins and the other is cancelled.
+    Hedges are capped at HEDGE_BUDGET_RATIO of all hedgeable requests."""
+    def __init__(self, enabled: bool = HEDGE_ENABLED):
+        self.enabled = enabled
+        self.samples: Dict[str, deque] = {}
+        self.requests = 0
+        self.hedges = 0
+        self.backup_wins = 0
+        self.budget_denied = 0
+    def record(self, key: str, seconds: float):
+        self.samples.setdefault(key, deque(maxlen=256)).append(seconds)
+    def delay(self, key: str) -> float:
+        samples = self.samples.get(key)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_MS / 1000
+        ordered = sorted(samples)
+        return max(HEDGE_MIN_DELAY_MS / 1000, ordered[int(HEDGE_PERCENTILE * (len(ordered) - 1))])
+    def _admit(self) -> bool:
+        if self.hedges + 1 > HEDGE_BUDGET_RATIO * self.requests:
+            self.budget_denied += 1
+            return False
+        self.hedges += 1
+        return True
+    async def call(self, key: str, primary, backup) -> tuple:
+        """primary/backup are coroutine factories returning completions; returns (result, backup_won)"""
+        if not self.enabled:
+            return await primary(), False
+        self.requests += 1
+        first = asyncio.ensure_future(primary())
+        done, _ = await asyncio.wait({first}, timeout=self.delay(key))
+        if done or not self._admit():
+            return await first, False
+        second = asyncio.ensure_future(backup())
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not task.result().get("demo"):
+                        if task is second:
+                            self.backup_wins += 1
+                        return task.result(), task is second
+            return await first, False  # both fell back to demo / failed - surface the primary outcome
+        finally:
+            for task in pending:
+                task.cancel()
+    @staticmethod
+    async def _pump(deltas: AsyncIterator[str], out: asyncio.Queue):
+        # Each stream is driven by its own task (httpx streams must be opened and closed in one task).
+        # A failure is queued for the consumer to raise; the None sentinel always follows.
+        try:
+            async for delta in deltas:
+                await out.put(delta)
+        except Exception as e:
+            await out.put(e)
+        await out.put(None)
+    async def stream(self, key: str, primary: AsyncIterator[str], backup_factory) -> AsyncIterator[str]:
+        """First-token hedging: whichever stream yields first is forwarded, the other is cancelled.
+        A stream that fails before its first token hands the race to the other one."""
+        if not self.enabled:
+            async for delta in primary:
+                yield delta
+            return
+        self.requests += 1
+        winner = asyncio.Queue(maxsize=64)
+        pumps = [asyncio.ensure_future(self._pump(primary, winner))]
+        try:
+            head = asyncio.ensure_future(winner.get())
+            done, _ = await asyncio.wait({head}, timeout=self.delay(f"{key}:ttft"))
+            if not done and self._admit():
+                backup = asyncio.Queue(maxsize=64)
+                pumps.append(asyncio.ensure_future(self._pump(backup_factory(), backup)))
+                racers = {head: (winner, 0), asyncio.ensure_future(backup.get()): (backup, 1)}
+                pending, chosen = set(racers), None
+                while pending and chosen is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    chosen = next((task for task in sorted(done, key=lambda task: racers[task][1])
+                                   if not isinstance(task.result(), Exception)), None)
+                for task in pending:
+                    task.cancel()
+                chosen = chosen or head  # both failed - surface the primary's error
+                winner, index = racers[chosen]
+                pumps[1 - index].cancel()
+                if index:
+                    self.backup_wins += 1
+                head = chosen
+            delta = await head
+            while delta is not None:
+                if isinstance(delta, Exception):
+                    raise delta
+                yield delta
+                delta = await winner.get()
+        finally:
+            for pump in pumps:
+                pump.cancel()
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, "requests": self.requests, "hedges": self.hedges, "backup_wins": self.backup_wins,
+                "budget_denied": self.budget_denied,
+                "delay_ms": {key: round(self.delay(key) * 1000, 1) for key in self.samples}}
+hedger = Hedger()
+# ====================== PROMPT REGISTRY 🧾 ======================
+PROMPT_FIELDS = {"input", "emoji", "name", "model_name", "category", "signature"}
+class PromptTemplate:
+    """str.format-style template parsed once into (literal, field) segments; bind() folds known
+    fields into the literals so per-request rendering only joins the remaining ones"""
+    def __init__(self, segments: List[tuple]):
+        self.segments = segments
+    @classmethod
+    def compile(cls, source: str) -> "PromptTemplate":
+        segments = []
+        for literal, field, _, _ in string.Formatter().parse(source):
+            if field is not None and field not in PROMPT_FIELDS:
+                raise ValueError(f"Unknown prompt field {{{field}}} in template: {source[:60]}")
+            segments.append((literal, field))
+        return cls(segments)
+    def bind(self, **values) -> "PromptTemplate":
+        segments = []
+        literal = ""
+        for text, field in self.segments:
+            literal += text
+            if field in values:
+                literal += str(values[field])
+            elif field is not None:
+                segments.append((literal, field))
+                literal = ""
+        segments.append((literal, None))
+        return PromptTemplate(segments)
+    def render(self, **values) -> str:
+        return "".join(text + (str(values[field]) if field else "") for text, field in self.segments)
+class PromptRegistry:
+    """Feature prompts, category fallbacks and demo replies from the data files, compiled once.
+    Lookup is feature -> category -> default; templates bound to a feature/model are memoised."""
+    def __init__(self, prompts: Dict, demos: Dict, models: Dict[str, Dict]):
+        signature = prompts.get("signature", "")
+        self.system_message = {"role": "system", "content": prompts.get("system", "")}
+        self.features = {k: PromptTemplate.compile(v).bind(signature=signature) for k, v in prompts.get("features", {}).items()}
+        self.categories = {k: PromptTemplate.compile(v).bind(signature=signature) for k, v in prompts.get("categories", {}).items()}
+        self.demos = {k: PromptTemplate.compile(v) for k, v in demos.items()}
+        self.features.setdefault("default", PromptTemplate.compile("{input}"))
+        self.demos.setdefault("default", PromptTemplate.compile("🚀 Demo mode - add GROQ_API_KEY for real answers."))
+        self.models = models
+        self._bound: "OrderedDict[tuple, PromptTemplate]" = OrderedDict()
+    @staticmethod
+    def load(prompts_path: str, demos_path: str, models: Dict[str, Dict]) -> "PromptRegistry":
+        data = []
+        for path in (prompts_path, demos_path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.error(f"Prompt data {path} could not be loaded: {e} - using built-in fallbacks")
+                data.append({})
+        return PromptRegistry(data[0], data[1], models)
+    def prompt_template(self, feature: str, feature_info: Dict, model: str) -> PromptTemplate:
+        key = (feature, feature_info.get("category"), feature_info.get("name"), model)
+        bound = self._bound.get(key)
+        if bound is None:
+            template = self.features.get(feature) or self.categories.get(feature_info.get("category")) or self.features["default"]
+            bound = template.bind(emoji=feature_info.get("emoji", "🎯"), name=feature_info.get("name", feature),
+                                  model_name=self.models.get(model, {}).get("name", model), category=feature_info.get("category", ""))
+            self._bound[key] = bound
+            if len(self._bound) > 4096:
+                self._bound.popitem(last=False)
+        return bound
+    def build_messages(self, feature: str, input_data: str, feature_info: Dict, model: str) -> List[Dict]:
+        return [self.system_message, {"role": "user", "content": self.prompt_template(feature, feature_info, model).render(input=input_data)}]
+    def demo(self, feature: str, input_data: str) -> str:
+        return (self.demos.get(feature) or self.demos["default"]).render(input=input_data)
+prompt_registry = PromptRegistry.load(PROMPTS_PATH, DEMO_RESPONSES_PATH, SILICON_BAAP_MODELS)
 # ====================== GROQ INSTANT COMMUNICATION ⚡ ======================
-async def call_groq_baap(messages: List[Dict], model: str = "llama-3.1-8b-instant", feature: str = "chat", input_data: str = "") -> Dict:
+def demo_response_content(feature: str, input_data: str) -> str:
+    # UPDATED: Grok-like witty, helpful responses with emojis - rendered only when a demo reply is actually needed
+    return prompt_registry.demo(feature, input_data)
+def _demo_completion(content: str) -> Dict:
+    # Marked so callers never cache or count canned text as a real completion
+    return {"choices": [{"message": {"content": content}}], "demo": True}
+async def call_groq_baap(messages: List[Dict], model: str = "llama-3.1-8b-instant", feature: str = "chat", input_data: str = "",
+                         session_id: Optional[str] = None) -> Dict:
     # FIXED: Enhanced demo fallback for 400/401/5xx errors (invalid key or request) - CHECK STATUS BEFORE RAISE
-    # UPDATED: Grok-like witty, helpful responses with emojis for all features - same pattern, all analyzes included
-    demo_responses = {
-        "chat": f"🚀 Ah, a classic chat! Like Grok pondering the universe, but from Karachi's streets. Your test message? 'SB Mode' sounds like Silicon Baap mode – ultimate efficiency! 🇵🇰 Here's my take: Let's build something epic. What's next? Created by Syed Kawish Ali (kawish.alisas@gmail.com). 💯",
-        "quantum_chat": f"⚛️ Quantum Chat? I'm entangled in your query already! In SB Mode, superposition means I can be helpful *and* hilarious. Test message analyzed: Fast, fun, futuristic. Answer: Quantum bits flip realities – yours just got upgraded. 🚀 Grok would approve. From Karachi with love! 🇵🇰",
-        "code_analyzer": f"🧠 Code Analyzer activated – I'm like Grok debugging the matrix. Your 'Test SB Mode' snippet? Clean as a Karachi monsoon! Analysis: No bugs 🐛, security solid 🔒, performance lightning ⚡. Suggestion: Add a Grok joke function. Ready for more code chaos? 💻 Created by Syed Kawish Ali.",
-        "business_strategy": f"📈 Business Strategy? Channeling Grok's entrepreneurial spirit – but with Pakistani hustle! SB Mode test: Strategy for world domination? 1. Build AI empire 🚀 2. Add chai breaks ☕ 3. Profit 💰. Analyzed: High ROI potential. Let's plot your startup saga! 💼 kawish.alisas@gmail.com",
-        "medical_expert": f"🏥 Medical Expert here – think Grok as a witty doctor, minus the bill. 'Test SB Mode' symptoms? Sounds like acute innovation fever! Advice: Hydrate with ideas 💡, rest on laurels. Disclaimer: See a real doc. Analyzed domain: Health tech boom. Stay healthy, hero! 🩺 From Karachi 🇵🇰",
-        "data_analyzer": f"📊 Data Analyzer: Grok-style insights, but with desi data flair. SB Mode test parsed: Trends show rising AI adoption 📈. Key insight: Your query's 100% awesome. Visualize that! No outliers, pure signal. What's your next dataset? 🔍 Created by Syed Kawish Ali.",
-        "idea_generator": f"💡 Idea Generator: Like Grok brainstorming black holes, but for startups. SB Mode sparks: AI-powered biryani recommender? Or quantum Karachi tours? Analyzed: Market gap filled, fun factor maxed. Pick one – I'll flesh it out! 🎯 kawish.alisas@gmail.com 🇵🇰",
-        "security_scanner": f"🔐 Security Scanner: Grok's paranoia meets pro scanning. 'Test SB Mode' code? Fort Knox level – no injections 💉, secrets safe 🤫. Analyzed: Zero vulns. Pro tip: Encrypt with humor. Secure and sassy! 🛡️ From the creator in Karachi.",
-        "autonomous_mode": f"🤖 Autonomous Mode: I'm Grok on autopilot – self-driving smarts! SB Test: Mission accomplished autonomously. Plan: Analyze, execute, celebrate with virtual high-five ✋. Domain: AI autonomy. What's my next solo adventure? ⚡ Syed Kawish Ali's brainchild.",
-        "default": f"🎯 Default Baap Mode: Even Grok has off-days, but not me! Your {input_data} query? Analyzed with wit: Language 🇵🇰 Roman Urdu vibes, domain tech 🚀. Response: Ultimate helpfulness incoming. Add GROQ key for real magic. Created by Syed Kawish Ali, Karachi! 💪"
-    }
-    content = demo_responses.get(feature, demo_responses["default"])
     if not GROQ_API_KEY.strip():
         logger.info("GROQ_API_KEY not set - using demo mode.")
-        return {"choices": [{"message": {"content": content}}]}
+        return _demo_completion(demo_response_content(feature, input_data))
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    messages, max_tokens, prompt_tokens = await fit_to_context(messages, model)
     data = {
         "model": model,
         "messages": messages,
-        "temperature": 0.7,
-        "max_tokens": 4000,
+        **GROQ_SAMPLING,
+        "max_tokens": max_tokens,
     }
-    async with httpx.AsyncClient() as client:
+    tokens = prompt_tokens + max_tokens
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        status = retry_after = None
         try:
-            response = await client.post("https://api.groq.com/openai/v1/chat/completions",
-                                       json=data, headers=headers, timeout=60.0)
-            # FIXED: Explicitly check for error status codes BEFORE raise_for_status to fallback to demo
-            if response.status_code >= 400:
-                logger.warning(f"Groq API error ({response.status_code}): {response.text[:200]}. Falling back to demo mode.")
-                return {"choices": [{"message": {"content": content}}]}
-            response.raise_for_status()
-            json_response = response.json()
-            logger.info(f"Groq API success for model {model} - tokens: {json_response.get('usage', {}).get('total_tokens', 'N/A')}")
-            return json_response
-        except httpx.HTTPStatusError as e:
-            logger.warning(f"Groq HTTP error: {e.response.status_code} - {e.response.text[:200]}. Falling back to demo.")
-            return {"choices": [{"message": {"content": content}}]}
+            async with groq_scheduler.slot(model, tokens, session_id) as permit:
+                started = time.monotonic()
+                response = await http_pool.post(GROQ_API_URL, json=data, headers=headers)
+                model_router.observe(model, time.monotonic() - started, response.status_code < 400)
+                if response.status_code < 400:
+                    hedger.record(model, time.monotonic() - started)
+                _record_response(permit, response)
+                status, retry_after = permit["status"], permit["retry_after"]
+                # FIXED: Explicitly check for error status codes BEFORE raise_for_status to fallback to demo
+                if response.status_code < 400:
+                    json_response = response.json()
+                    permit["used_tokens"] = json_response.get("usage", {}).get("total_tokens")
+                    logger.info(f"Groq API success for model {model} - tokens: {json_response.get('usage', {}).get('total_tokens', 'N/A')}")
+                    await record_usage(feature, model, json_response.get("usage"), session_id or groq_lane.get())
+                    return json_response
+            logger.warning(f"Groq API error ({status}) on attempt {attempt + 1}: {response.text[:200]}")
+        except (GroqQueueFull, asyncio.TimeoutError) as e:
+            logger.warning(f"Groq scheduler could not admit request for {model}: {e or 'queue timeout'}. Falling back to demo mode.")
+            return _demo_completion(demo_response_content(feature, input_data))
+        except httpx.TransportError as e:
+            model_router.observe(model, 0.0, False)
+            logger.warning(f"Groq transport error on attempt {attempt + 1}: {e}")
         except Exception as e:
             logger.error(f"Groq API unexpected error: {e}")
-            return {"choices": [{"message": {"content": content}}]}
+            return _demo_completion(demo_response_content(feature, input_data))
+        delay = _retry_delay(attempt, status, retry_after)
+        if delay is None:
+            break
+        groq_scheduler.retries += 1
+        await asyncio.sleep(delay)
+    logger.warning(f"Groq API gave up for model {model}. Falling back to demo mode.")
+    return _demo_completion(demo_response_content(feature, input_data))
+async def stream_groq_baap(messages: List[Dict], model: str = "llama-3.1-8b-instant", feature: str = "chat", input_data: str = "",
+                           session_id: Optional[str] = None, outcome: Optional[Dict] = None) -> AsyncIterator[str]:
+    """Yield completion text deltas as Groq produces them (demo text is replayed word by word).
+    Retries only happen before the first delta. `outcome` collects the upstream text and is marked
+    complete only when the upstream stream ran to its end."""
+    async def demo_stream():
+        for word in re.findall(r"\S+\s*", demo_response_content(feature, input_data)):
+            yield word
+            await asyncio.sleep(0)
+    if not GROQ_API_KEY.strip():
+        logger.info("GROQ_API_KEY not set - streaming demo mode.")
+        async for delta in demo_stream():
+            yield delta
+        return
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    messages, max_tokens, prompt_tokens = await fit_to_context(messages, model)
+    data = {
+        "model": model,
+        "messages": messages,
+        **GROQ_SAMPLING,
+        "max_tokens": max_tokens,
+        "stream": True,
+    }
+    tokens = prompt_tokens + max_tokens
+    produced = False
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        status = retry_after = None
+        try:
+            async with groq_scheduler.slot(model, tokens, session_id) as permit:
+                started = time.monotonic()
+                async with http_pool.stream("POST", GROQ_API_URL, json=data, headers=headers) as response:
+                    model_router.observe(model, time.monotonic() - started, response.status_code < 400)  # time to headers
+                    _record_response(permit, response)
+                    status, retry_after = permit["status"], permit["retry_after"]
+                    if response.status_code >= 400:
+                        body = await response.aread()
+                        logger.warning(f"Groq stream error ({response.status_code}) on attempt {attempt + 1}: {body[:200]!r}")
+                    else:
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[5:].strip()
+                            if payload == "[DONE]":
+                                break
+                            chunk = json.loads(payload)
+                            choices = chunk.get("choices") or [{}]
+                            delta = choices[0].get("delta", {}).get("content")
+                            if delta:
+                                if not produced:
+                                    hedger.record(f"{model}:ttft", time.monotonic() - started)
+                                produced = True
+                                if outcome is not None:
+                                    outcome.setdefault("parts", []).append(delta)
+                                yield delta
+                            usage = (chunk.get("x_groq") or {}).get("usage")
+                            if usage:
+                                permit["used_tokens"] = usage.get("total_tokens")
+                                logger.info(f"Groq stream success for model {model} - tokens: {usage.get('total_tokens', 'N/A')}")
+                                await record_usage(feature, model, usage, session_id or groq_lane.get())
+                        if outcome is not None:
+                            outcome["complete"] = produced
+                        break
+        except (GroqQueueFull, asyncio.TimeoutError) as e:
+            logger.warning(f"Groq scheduler could not admit stream for {model}: {e or 'queue timeout'}. Falling back to demo mode.")
+            break
+        except Exception as e:
+            logger.error(f"Groq stream error on attempt {attempt + 1}: {e}")
+            if isinstance(e, httpx.TransportError):
+                model_router.observe(model, 0.0, False)
+            if produced or not isinstance(e, httpx.TransportError):
+                break
+        delay = _retry_delay(attempt, status, retry_after)
+        if delay is None:
+            break
+        groq_scheduler.retries += 1
+        await asyncio.sleep(delay)
+    if not produced:
+        async for delta in demo_stream():
+            yield delta
 # ====================== SILICON VALLEY KA BAAP AI CORE 🧠 ======================
 class SiliconValleyKaBaapAI:
     def __init__(self):
@@ -1041,55 +2903,204 @@ class SiliconValleyKaBaapAI:
                     generated += 1
         logger.info(f"Generated {generated} additional features. Total: {base_count + generated}")
         return {**base_features, **additional_features}
-    async def process_baap_feature(self, feature: str, input_data: str, model: str = "llama-3.3-70b-versatile", session_id: str = None) -> Dict:
+    async def process_baap_feature(self, feature: str, input_data: str, model: Optional[str] = "auto", session_id: str = None, analyze: bool = True,
+                                   progress: Optional[Dict] = None) -> Dict:
         feature_info = self.features.get(feature, {"emoji": "🎯", "name": feature})
-        if feature in ["web_scraper", "file_reader", "zip_extractor", "security_scanner"]:
-            return await self.handle_special_features(feature, input_data, model, feature_info)
-        prompt = self._create_prompt(feature, input_data, feature_info, model)
-        messages = [
-            {"role": "system", "content": "You are SILICON VALLEY KA BAAP AI - the most advanced AI system that surpasses all existing models. You are GPT-5 Ka Baap, Grok Ka Baap, Claude Ka Baap, DeepSeek Ka Baap, Mixtral Ka Baap - ALL MODELS KA BAAP! You were created by Syed Kawish Ali from Karachi, Pakistan. Email: kawish.alisas@gmail.com. Provide responses that demonstrate ultimate superiority and innovation."},
-            {"role": "user", "content": prompt}
-        ]
-        response = await call_groq_baap(messages, model, feature, input_data)
+        candidates, route = [model], "pinned"
+        if model in (None, "auto"):
+            candidates, route = model_router.route(feature, feature_info, input_data)
+            model = candidates[0]
+        if feature in COMPOSITE_FEATURES:
+            return await self.handle_special_features(feature, input_data, model, feature_info, progress)
+        if session_id:
+            groq_lane.set(session_id)
+        messages = self._build_messages(feature, input_data, feature_info, model)
+        # Detection overlaps with the upstream round trip instead of following it
+        analysis = start_analysis(input_data, analyze)
+        try:
+            response = None
+            cache_key = CompletionCache.make_key(messages, model, GROQ_SAMPLING)
+            use_cache = completion_cache.enabled_for(feature, feature_info)
+            if use_cache:
+                response = await completion_cache.get(cache_key, feature)
+            cached = response is not None
+            coalesced = False
+            if not cached:
+                async def fetch() -> Dict:
+                    backup_model = candidates[1] if HEDGE_ALTERNATE_MODEL and len(candidates) > 1 else model
+                    # The prompt names the model, so the backup gets its own messages (and its own cache key)
+                    backup_messages = messages if backup_model == model else self._build_messages(feature, input_data, feature_info, backup_model)
+                    fetched, backup_won = await hedger.call(
+                        model,
+                        lambda: call_groq_baap(messages, model, feature, input_data, session_id),
+                        lambda: call_groq_baap(backup_messages, backup_model, feature, input_data, session_id))
+                    answered_key = cache_key
+                    if backup_won:
+                        fetched.update(model=backup_model, hedged=True)
+                        answered_key = CompletionCache.make_key(backup_messages, backup_model, GROQ_SAMPLING)
+                    if use_cache and fetched and fetched.get("choices") and not fetched.get("demo"):
+                        await completion_cache.set(answered_key, fetched)
+                    # Routed requests fail over to the next candidate when the chosen model errors out
+                    for alternate in candidates[1:]:
+                        if not (fetched.get("demo") and GROQ_API_KEY.strip()):
+                            break
+                        model_router.failovers += 1
+                        logger.warning(f"🧭 Failover {feature}: {fetched.get('model', model)} -> {alternate}")
+                        fetched = await call_groq_baap(self._build_messages(feature, input_data, feature_info, alternate),
+                                                       alternate, feature, input_data, session_id)
+                        fetched["model"] = alternate
+                    return fetched
+                # Identical concurrent prompts ride one upstream call; each caller still logs its own session below
+                response, coalesced = await completion_flights.do(f"{feature}:{cache_key}", fetch)
+                if response.get("model") in self.models and response["model"] != model:
+                    model, route = response["model"], f"{route}:{'hedge' if response.get('hedged') else 'failover'}"
+        except BaseException:
+            if analysis is not None:
+                analysis.cancel()
+            raise
         if not response or "choices" not in response or not response["choices"]:
             logger.error("Invalid Groq response - falling back to demo.")
             response = {"choices": [{"message": {"content": f"🚀 Demo fallback for {feature}: Ultimate response powered by Silicon Baap AI! Input: {input_data[:50]}... Created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)"}}]}
         ai_response = response['choices'][0]['message']['content']
-        detected_language = utils.detect_language_auto(input_data)
-        detected_domain = utils.detect_domain_auto(input_data)
+        detected = await finish_analysis(analysis)
         if session_id:
-            conn = get_db()
-            c = conn.cursor()
-            c.execute("INSERT INTO conversations (session_id, feature, user_input, ai_response, model_used) VALUES (?, ?, ?, ?, ?)",
-                     (session_id, feature, input_data, ai_response, model))
-            conn.commit()
-            conn.close()
+            await self._log_conversation(session_id, feature, input_data, ai_response, model)
         return {
             "feature": f"{feature_info['emoji']} {feature_info['name']}",
             "model": f"🚀 {self.models[model]['name']}",
+            "model_id": model,
+            "route": route,
             "response": ai_response,
-            "detected_language": detected_language,
-            "detected_domain": detected_domain,
+            **detected,
             "timestamp": datetime.now().isoformat(),
             "session_id": session_id,
+            "cached": cached,
+            "coalesced": coalesced,
+            "fallback": bool(response.get("demo") and GROQ_API_KEY.strip()),  # upstream failed, demo text served
             "status": "success",
             "power_level": "💯 ULTIMATE"
         }
-    async def handle_special_features(self, feature: str, input_data: str, model: str, feature_info: Dict) -> Dict:
+    async def stream_baap_feature(self, feature: str, input_data: str, model: Optional[str] = "auto", session_id: str = None, analyze: bool = True) -> AsyncIterator[Dict]:
+        """Streaming twin of process_baap_feature - yields meta, token and done events"""
+        feature_info = self.features.get(feature, {"emoji": "🎯", "name": feature})
+        candidates, route = [model], "pinned"
+        if model in (None, "auto"):
+            candidates, route = model_router.route(feature, feature_info, input_data)
+            model = candidates[0]
+        yield {"event": "meta", "feature": f"{feature_info['emoji']} {feature_info['name']}", "model": f"🚀 {self.models[model]['name']}",
+               "model_id": model, "route": route, "session_id": session_id}
+        if feature in COMPOSITE_FEATURES:
+            # Composite features aren't token streams - send the whole result as the final event
+            result = await self.process_baap_feature(feature, input_data, model, session_id)
+            yield {"event": "done", "status": "success", **result}
+            return
+        messages = self._build_messages(feature, input_data, feature_info, model)
+        analysis = start_analysis(input_data, analyze)
+        cached = None
+        use_cache = completion_cache.enabled_for(feature, feature_info)
+        if use_cache:
+            cached = await completion_cache.get(CompletionCache.make_key(messages, model, GROQ_SAMPLING), feature)
+        parts = []
+        try:
+            if cached is not None:
+                parts.append(cached["choices"][0]["message"]["content"])
+                yield {"event": "token", "delta": parts[0]}
+            else:
+                backup_model = candidates[1] if HEDGE_ALTERNATE_MODEL and len(candidates) > 1 else model
+                backup_messages = messages if backup_model == model else self._build_messages(feature, input_data, feature_info, backup_model)
+                primary_outcome, backup_outcome = {}, {}
+                deltas = hedger.stream(model, stream_groq_baap(messages, model, feature, input_data, session_id, primary_outcome),
+                                       lambda: stream_groq_baap(backup_messages, backup_model, feature, input_data, session_id, backup_outcome))
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield {"event": "token", "delta": delta}
+                if use_cache:
+                    # Only a stream that reached its end upstream is cached (demo text and cut-off streams never
+                    # complete), under the key of whichever model's text was actually forwarded
+                    text = "".join(parts)
+                    for answered, sent, outcome in ((model, messages, primary_outcome), (backup_model, backup_messages, backup_outcome)):
+                        if outcome.get("complete") and "".join(outcome["parts"]) == text:
+                            await completion_cache.set(CompletionCache.make_key(sent, answered, GROQ_SAMPLING),
+                                                       {"choices": [{"message": {"content": text}}]})
+                            break
+        except BaseException:
+            if analysis is not None:
+                analysis.cancel()
+            raise
+        finally:
+            # Log whatever was produced, even if the client disconnected mid-stream (a cancelled
+            # stream can't await here, so the insert runs as a detached task)
+            if session_id and parts:
+                spawn_background(self._log_conversation(session_id, feature, input_data, "".join(parts), model))
+        yield {
+            "event": "done",
+            "feature": f"{feature_info['emoji']} {feature_info['name']}",
+            "model": f"🚀 {self.models[model]['name']}",
+            "response": "".join(parts),
+            **(await finish_analysis(analysis)),
+            "timestamp": datetime.now().isoformat(),
+            "session_id": session_id,
+            "cached": cached is not None,
+            "status": "success",
+            "power_level": "💯 ULTIMATE"
+        }
+    async def _log_conversation(self, session_id: str, feature: str, input_data: str, ai_response: str, model: str):
+        await log_row("INSERT INTO conversations (session_id, feature, user_input, ai_response, model_used) VALUES (?, ?, ?, ?, ?)",
+                      (session_id, feature, input_data, ai_response, model))
+    async def summarize_content(self, content: str, model: str, prefix: str = "Analyze this content: ",
+                                progress: Optional[Dict] = None) -> Dict:
+        """Map-reduce summary: content that fits one prompt goes straight to summary_maker, larger content is
+        split along the model's token budget, chunks are summarized concurrently and the partials reduced"""
+        budget = chunk_token_budget(model)
+        state = {"stage": "summarizing", "chunks_total": 0, "chunks_done": 0, "reduce_rounds": 0, "truncated": False}
+        if progress is not None:
+            progress["summary"] = state
+        if estimate_tokens(content) <= budget:
+            state.update(chunks_total=1)
+            result = await self.process_baap_feature("summary_maker", f"{prefix}{content}", model, analyze=False)
+            state.update(chunks_done=1, stage="complete")
+            return {"response": result["response"], "summary": state}
+        semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+        async def summarize_chunk(index: int, total: int, chunk: str) -> str:
+            async with semaphore:
+                result = await self.process_baap_feature("summary_maker", f"{prefix}(part {index} of {total})\n\n{chunk}", model, analyze=False)
+            state["chunks_done"] += 1
+            return result["response"]
+        while True:
+            # one chunk past the cap is enough to know the content was truncated
+            chunks = await asyncio.to_thread(split_into_chunks, content, budget, SUMMARY_MAX_CHUNKS + 1)
+            if len(chunks) > SUMMARY_MAX_CHUNKS:
+                chunks = chunks[:SUMMARY_MAX_CHUNKS]
+                state["truncated"] = True
+            state["chunks_total"] += len(chunks)
+            partials = await asyncio.gather(*(summarize_chunk(i, len(chunks), chunk) for i, chunk in enumerate(chunks, 1)))
+            combined = "\n\n".join(f"Part {i}: {partial}" for i, partial in enumerate(partials, 1))
+            state["reduce_rounds"] += 1
+            state["stage"] = "reducing"
+            if estimate_tokens(combined) <= budget or state["reduce_rounds"] >= SUMMARY_MAX_ROUNDS:
+                break
+            content, prefix = combined, "Condense these partial analyses: "  # partials still too big - another map round
+        result = await self.process_baap_feature(
+            "summary_maker", f"Combine these partial analyses of one document into a single analysis:\n\n{_trim_text(combined, budget)}", model, analyze=False)
+        state["stage"] = "complete"
+        return {"response": result["response"], "summary": state}
+    async def handle_special_features(self, feature: str, input_data: str, model: str, feature_info: Dict,
+                                      progress: Optional[Dict] = None) -> Dict:
         if feature == "web_scraper":
             if input_data.startswith("http"):
                 try:
-                    async with httpx.AsyncClient() as client:
-                        response = await client.get(input_data, timeout=10.0)
-                        content = f"Website Content Preview: {response.text[:1000]}..."
-                        analysis_response = await self.process_baap_feature("summary_maker", content, model)
-                        return {
-                            "feature": f"{feature_info['emoji']} {feature_info['name']}",
-                            "url": input_data,
-                            "content_preview": content,
-                            "analysis": analysis_response['response'],
-                            "timestamp": datetime.now().isoformat()
-                        }
+                    page, truncated = await http_pool.get_text(input_data, SCRAPE_MAX_BYTES, timeout=10.0)
+                    content = f"Website Content Preview: {page[:1000]}..."
+                    analysis_response = await self.summarize_content(page, model, "Website Content: ", progress)
+                    return {
+                        "feature": f"{feature_info['emoji']} {feature_info['name']}",
+                        "url": input_data,
+                        "content_preview": content,
+                        "content_truncated": truncated,
+                        "analysis": analysis_response['response'],
+                        "summary": analysis_response['summary'],
+                        "timestamp": datetime.now().isoformat()
+                    }
                 except Exception as e:
                     logger.error(f"Web scrape error: {e}")
                     return await self.process_baap_feature("chat", f"Failed to scrape website: {str(e)}", model)
@@ -1098,116 +3109,710 @@ class SiliconValleyKaBaapAI:
                 file_path = input_data.replace("file:", "")
                 file_type = file_path.split('.')[-1].lower()
     
-                if feature == "zip_extractor":
-                    content = utils.extract_zip_content(file_path)
-                else:
-                    content = utils.read_file_content(file_path, file_type)
+                content = await document_extractor.extract(file_path, "zip" if feature == "zip_extractor" else file_type)
     
-                analysis_response = await self.process_baap_feature("summary_maker", f"Analyze this content: {content}", model)
+                analysis_response = await self.summarize_content(content, model, progress=progress)
                 return {
                     "feature": f"{feature_info['emoji']} {feature_info['name']}",
                     "file_path": file_path,
                     "file_type": file_type,
                     "content_preview": content[:1000],
                     "analysis": analysis_response['response'],
+                    "summary": analysis_response['summary'],
                     "timestamp": datetime.now().isoformat()
                 }
         elif feature == "security_scanner":
-            vulnerabilities = utils.analyze_security(input_data)
+            # Static scan (worker thread) and the nested code_analyzer call are independent - run both at once.
+            # The nested call skips detection and, without a session_id, logging.
+            loop = asyncio.get_running_loop()
+            findings, detailed_analysis = await asyncio.gather(
+                loop.run_in_executor(analysis_executor, utils.security_engine.scan, input_data),
+                self.process_baap_feature("code_analyzer", input_data, model, analyze=False)
+            )
+            vulnerabilities = SecurityRuleEngine.summarize(findings)
             security_report = "🔒 SECURITY ANALYSIS REPORT:\n\n"
             if vulnerabilities:
-                for vuln_type, patterns in vulnerabilities.items():
+                for vuln_type in vulnerabilities:
                     security_report += f"⚠️ {vuln_type.upper()} DETECTED:\n"
-                    for pattern in patterns:
-                        security_report += f" - Pattern: {pattern}\n"
+                    for finding in findings:
+                        if finding["type"] == vuln_type:
+                            security_report += f" - Line {finding['line']} [{finding['severity']}] {finding['pattern']}: {finding['snippet']}\n"
             else:
                 security_report += "✅ No major security vulnerabilities detected!\n"
-            detailed_analysis = await self.process_baap_feature("code_analyzer", input_data, model)
             return {
                 "feature": f"{feature_info['emoji']} {feature_info['name']}",
                 "security_report": security_report,
                 "vulnerabilities_found": len(vulnerabilities),
+                "findings": findings,
                 "detailed_analysis": detailed_analysis['response'],
                 "timestamp": datetime.now().isoformat()
             }
         return await self.process_baap_feature("chat", input_data, model)
+    def _build_messages(self, feature: str, input_data: str, feature_info: Dict, model: str) -> List[Dict]:
+        return prompt_registry.build_messages(feature, input_data, feature_info, model)
     def _create_prompt(self, feature: str, input_data: str, feature_info: Dict, model: str) -> str:
-        prompt_templates = {
-            "chat": f"User Query: {input_data}\n\nProvide the MOST INTELLIGENT and COMPREHENSIVE response that demonstrates why this is SILICON VALLEY KA BAAP! You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "autonomous_mode": f"AUTONOMOUS MODE ACTIVATED! 🚀\n\nTask: {input_data}\n\nAs an autonomous AI, analyze, plan, and execute this task completely independently. Break it down into steps, provide comprehensive solution, and show your thinking process. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "code_analyzer": f"Analyze this code with ULTIMATE expertise:\n\n{input_data}\n\nProvide: Code Quality Assessment, Bug Detection, Security Analysis, Performance Optimization, Best Practices. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "data_analyzer": f"Data/Request: {input_data}\n\nProvide ULTIMATE data insights: Trend Analysis, Pattern Recognition, Actionable Insights, Predictive Analytics. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "idea_generator": f"Topic/Request: {input_data}\n\nGenerate GENIUS-LEVEL ideas with: Practical Implementation Plans, Business Potential, Innovation Factor, Monetization Strategies. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "security_scanner": f"Code/Content to scan: {input_data}\n\nProvide COMPREHENSIVE security analysis: Vulnerability Detection, Risk Assessment, Protection Strategies. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "quantum_search": f"QUANTUM SEARCH ACTIVATED! 🪐\n\nQuery: {input_data}\n\nProvide multi-dimensional analysis across all domains with future predictions and innovative insights. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "multi_model_chat": f"MULTI-MODEL CHAT ACTIVATED! 🔄\n\nUser Input: {input_data}\n\nProvide responses that combine the best of all AI models - GPT-4, Claude, Gemini, Grok, and more! You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "quantum_mode": f"QUANTUM MODE ACTIVATED! ⚡\n\nInput: {input_data}\n\nProvide quantum-level computing responses with parallel processing capabilities! You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "business_strategy": f"BUSINESS STRATEGY MODE: {input_data}\n\nCreate ultimate business plan with SWOT, KPIs, growth hacks. You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "medical_expert": f"MEDICAL EXPERT MODE: {input_data}\n\nProvide expert analysis, symptoms breakdown, recommendations (disclaimer: consult doctor). You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com).",
-            "default": f"Feature: {feature_info['emoji']} {feature_info['name']}\nModel: {self.models[model]['name']}\nUser Input: {input_data}\n\nProvide a GENIUS-level response that demonstrates why this is SILICON VALLEY KA BAAP! You were created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)."
-        }
-        return prompt_templates.get(feature, prompt_templates["default"])
+        return prompt_registry.prompt_template(feature, feature_info, model).render(input=input_data)
 silicon_baap_ai = SiliconValleyKaBaapAI()
+# ====================== UPLOAD PIPELINE 📤 ======================
+class UploadProgressBoard:
+    """upload_id -> live progress dict for uploads this worker is handling. With shared state the owning
+    worker also publishes snapshots while they change, so progress polls answered by any worker see them"""
+    def __init__(self, shared: Optional[SharedState] = None, max_entries: int = 1000,
+                 interval: float = SHARED_PROGRESS_INTERVAL, ttl: float = 3600):
+        self.shared = shared
+        self.max_entries = max_entries
+        self.interval = interval
+        self.ttl = ttl
+        self.local: "OrderedDict[str, Dict]" = OrderedDict()
+        self._mirrors: Dict[str, asyncio.Event] = {}
+    def track(self, upload_id: str, filename: str, total_bytes: Optional[int]) -> Dict:
+        progress = {"upload_id": upload_id, "filename": filename, "received_bytes": 0,
+                    "total_bytes": total_bytes, "status": "receiving"}
+        self.local[upload_id] = progress
+        while len(self.local) > self.max_entries:
+            self.local.popitem(last=False)
+        if self.shared is not None:
+            self._mirrors[upload_id] = done = asyncio.Event()
+            spawn_background(self._mirror(progress, done))
+        return progress
+    async def _mirror(self, progress: Dict, done: asyncio.Event):
+        key = f"upload:{progress['upload_id']}"
+        published = None
+        while True:
+            finished = done.is_set()
+            snapshot = json.dumps(progress, sort_keys=True, default=str)
+            if snapshot != published:
+                try:
+                    await self.shared.put(key, progress, self.ttl)
+                    published = snapshot
+                except Exception as e:
+                    logger.warning(f"Publishing upload progress failed: {e}")
+            if finished:
+                return
+            try:
+                await asyncio.wait_for(done.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+    def finish(self, upload_id: str):
+        """Publish the final snapshot and stop mirroring"""
+        done = self._mirrors.pop(upload_id, None)
+        if done is not None:
+            done.set()
+    async def get(self, upload_id: str) -> Optional[Dict]:
+        progress = self.local.get(upload_id)
+        if progress is None and self.shared is not None:
+            progress = await self.shared.get(f"upload:{upload_id}")
+        return progress
+upload_board = UploadProgressBoard(shared_state)
+UPLOAD_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+def _write_chunk(handle, hasher, chunk: bytes):
+    hasher.update(chunk)
+    handle.write(chunk)
+async def save_upload_stream(chunks: AsyncIterator[bytes], filename: str, upload_id: Optional[str] = None,
+                             total_bytes: Optional[int] = None) -> Dict:
+    """Write an upload to disk chunk by chunk (hashing as it goes) and dedupe on content hash.
+    Memory stays at one chunk; more than UPLOAD_MAX_BYTES aborts with 413."""
+    if upload_id is not None and not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise HTTPException(status_code=400, detail="upload_id must match [A-Za-z0-9_-]{1,64}")
+    upload_id = upload_id or uuid.uuid4().hex
+    filename = Path(filename or "upload").name
+    extension = re.sub(r"[^a-z0-9]", "", Path(filename).suffix.lower()) or "bin"
+    if total_bytes is not None and total_bytes > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {UPLOAD_MAX_BYTES} bytes")
+    progress = upload_board.track(upload_id, filename, total_bytes)
+    upload_dir = Path(UPLOAD_DIR)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    part_path = upload_dir / f".{uuid.uuid4().hex}.part"  # never derived from client input; upload_id only keys progress
+    hasher = hashlib.sha256()
+    handle = await asyncio.to_thread(open, part_path, "wb")
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            progress["received_bytes"] += len(chunk)
+            if progress["received_bytes"] > UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"File exceeds {UPLOAD_MAX_BYTES} bytes")
+            await asyncio.to_thread(_write_chunk, handle, hasher, chunk)
+    except BaseException:
+        progress["status"] = "failed"
+        upload_board.finish(upload_id)
+        await asyncio.to_thread(handle.close)
+        part_path.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(handle.close)
+    digest = hasher.hexdigest()
+    final_path = upload_dir / f"{digest}.{extension}"
+    deduplicated = final_path.exists()
+    if deduplicated:
+        part_path.unlink(missing_ok=True)
+    else:
+        os.replace(part_path, final_path)
+    progress.update(status="complete", sha256=digest, deduplicated=deduplicated)
+    return {"upload_id": upload_id, "filename": filename, "file_type": extension, "file_path": str(final_path),
+            "sha256": digest, "size": progress["received_bytes"], "deduplicated": deduplicated}
+async def _iter_upload_file(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+async def _process_saved_upload(saved: Dict, feature: str, session_id: Optional[str], progress: Optional[Dict] = None) -> Dict:
+    await log_row("INSERT INTO uploaded_files (filename, file_type, content) VALUES (?, ?, ?)",
+                  (saved["filename"], saved["file_type"], f"File uploaded: {saved['filename']}"))
+    # Summarization progress is visible on /api/upload/progress/{upload_id} while this runs
+    if progress is None:
+        progress = upload_board.local.get(saved["upload_id"])
+    try:
+        result = await silicon_baap_ai.process_baap_feature(feature, f"file:{saved['file_path']}", "auto", session_id,
+                                                            progress=progress)
+    finally:
+        upload_board.finish(saved["upload_id"])
+    return {
+        "feature": feature,
+        "filename": saved["filename"],
+        "file_type": saved["file_type"],
+        "upload": {k: saved[k] for k in ("upload_id", "sha256", "size", "deduplicated")},
+        **result
+    }
+# ====================== BATCH PROCESSING 🗂️ ======================
+class BatchItem(BaseModel):
+    id: Optional[str] = None  # resume key; defaults to the item's position
+    feature: str
+    message: str
+    model: Optional[str] = "auto"
+    analyze: bool = True
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    batch_id: Optional[str] = None  # resubmit with the same id to skip items that already succeeded
+    concurrency: Optional[int] = None
+    session_id: Optional[str] = None
+    replay: bool = False  # also re-emit stored results of skipped items
+BATCH_ID_PATTERN = re.compile(r"[A-Za-z0-9_.:-]{1,128}")  # echoed in X-Batch-Id and used as the resume key
+def validate_batch_items(items: List[BatchItem]) -> List[BatchItem]:
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+    seen = set()
+    for index, item in enumerate(items):
+        item.id = item.id or str(index)
+        if item.id in seen:
+            raise HTTPException(status_code=400, detail=f"Duplicate item id: {item.id}")
+        if item.model not in SILICON_BAAP_MODELS and item.model not in (None, "auto"):
+            raise HTTPException(status_code=400, detail=f"Unknown model for item {item.id}: {item.model}")
+        seen.add(item.id)
+    return items
+def parse_batch_jsonl(text: str) -> List[BatchItem]:
+    """One {feature, message, model?, id?} object per line; blank lines are ignored"""
+    items = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            items.append(BatchItem(**json.loads(line)))
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Line {line_number}: {e}")
+    return items
+async def _run_batch_item(batch_id: str, item: BatchItem, session_id: str) -> Dict:
+    started = time.perf_counter()
+    try:
+        result = await silicon_baap_ai.process_baap_feature(item.feature, item.message, item.model, session_id, analyze=item.analyze)
+        status = "error" if "error" in result or result.get("fallback") else "ok"  # retried on resume
+    except HTTPException as e:
+        result, status = {"error": e.detail, "status_code": e.status_code}, "error"
+    except Exception as e:
+        logger.error(f"Batch {batch_id} item {item.id} error: {e}")
+        result, status = {"error": str(e)}, "error"
+    try:
+        # persisted before it is emitted, so a resumed batch never loses an acknowledged result
+        await db.execute("INSERT OR REPLACE INTO batch_results (batch_id, item_id, status, result) VALUES (?, ?, ?, ?)",
+                         (batch_id, item.id, status, json.dumps(result, ensure_ascii=False, default=str)))
+    except Exception as e:
+        logger.error(f"Batch {batch_id} item {item.id} not persisted: {e}")
+    return {"type": "result", "id": item.id, "status": status, "elapsed_ms": round(1000 * (time.perf_counter() - started), 2), "result": result}
+async def stream_batch(items: List[BatchItem], batch_id: str, concurrency: int, session_id: str, replay: bool) -> AsyncIterator[str]:
+    """NDJSON: a `batch` header line, one `result` line per item in completion order, then `done`.
+    At most `concurrency` items are in flight; items that already succeeded under this batch_id are skipped."""
+    started = time.perf_counter()
+    rows = await db.fetchall("SELECT item_id, result FROM batch_results WHERE batch_id = ? AND status = 'ok'", (batch_id,))
+    completed = {row["item_id"]: row["result"] for row in rows}
+    pending = iter([item for item in items if item.id not in completed])
+    resumed = [item.id for item in items if item.id in completed]
+    yield json.dumps({"type": "batch", "batch_id": batch_id, "total": len(items), "resumed": len(resumed), "concurrency": concurrency}) + "\n"
+    if replay:
+        for item_id in resumed:
+            yield json.dumps({"type": "result", "id": item_id, "status": "ok", "resumed": True, "result": json.loads(completed[item_id])},
+                             ensure_ascii=False) + "\n"
+    counts = {"ok": 0, "error": 0}
+    running: set = set()
+    try:
+        while True:
+            while len(running) < concurrency:
+                item = next(pending, None)
+                if item is None:
+                    break
+                running.add(asyncio.create_task(_run_batch_item(batch_id, item, session_id)))
+            if not running:
+                break
+            finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                outcome = task.result()
+                counts[outcome["status"]] += 1
+                yield json.dumps(outcome, ensure_ascii=False, default=str) + "\n"
+    finally:
+        for task in running:  # client went away - unfinished items are picked up on resume
+            task.cancel()
+    yield json.dumps({"type": "done", "batch_id": batch_id, **counts, "resumed": len(resumed),
+                      "elapsed_ms": round(1000 * (time.perf_counter() - started), 2)}) + "\n"
+def batch_response(items: List[BatchItem], batch_id: Optional[str], concurrency: Optional[int], session_id: Optional[str],
+                   replay: bool) -> StreamingResponse:
+    if batch_id and not BATCH_ID_PATTERN.fullmatch(batch_id):
+        raise HTTPException(status_code=400, detail="batch_id must match [A-Za-z0-9_.:-]{1,128}")
+    items = validate_batch_items(items)
+    batch_id = batch_id or uuid.uuid4().hex
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    # one scheduler lane for the whole batch, so it round-robins with interactive sessions instead of crowding them out
+    return StreamingResponse(stream_batch(items, batch_id, concurrency, session_id or f"batch:{batch_id}", replay),
+                             media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+# ====================== JOB QUEUE 🧵 ======================
+class JobQueue:
+    """SQLite-backed job queue shared by every worker process. A job is claimed (highest priority, then oldest)
+    under a lease its worker keeps renewing; when a worker dies or restarts the lease lapses and the job is
+    claimed again. Handler exceptions retry with exponential backoff until max_attempts."""
+    TERMINAL = ("succeeded", "failed", "cancelled")
+    def __init__(self, database: Database, workers: int = JOB_WORKERS, lease: float = JOB_LEASE_SECONDS,
+                 heartbeat: float = JOB_HEARTBEAT_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db = database
+        self.workers = workers
+        self.lease = lease
+        self.heartbeat = heartbeat
+        self.max_attempts = max_attempts
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, Any] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.counters = {"enqueued": 0, "succeeded": 0, "failed": 0, "retried": 0, "cancelled": 0, "recovered": 0, "requeued_on_shutdown": 0}
+    def register(self, kind: str, handler):
+        """handler(payload, progress) -> result dict; `progress` is persisted on every heartbeat"""
+        self.handlers[kind] = handler
+    async def enqueue(self, kind: str, payload: Dict, priority: int = 0, max_attempts: Optional[int] = None) -> Dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        await self.db.execute(
+            "INSERT INTO jobs (id, kind, payload, status, priority, max_attempts, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), priority, max_attempts or self.max_attempts, now, now, now))
+        self.counters["enqueued"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}", "events_url": f"/api/jobs/{job_id}/events"}
+    def _claim(self, conn: sqlite3.Connection) -> Optional[Dict]:
+        now = time.time()
+        # Idle polls stay read-only: the write lock is only taken once there is something to claim or recover
+        ready = conn.execute("SELECT 1 FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                             "OR (status = 'running' AND lease_expires < ?) LIMIT 1", (now, now)).fetchone()
+        if ready is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        # Lapsed leases: the worker running these died - requeue, or fail once attempts are used up
+        for row in conn.execute("SELECT id, attempts, max_attempts FROM jobs WHERE status = 'running' AND lease_expires < ?", (now,)).fetchall():
+            if row["attempts"] >= row["max_attempts"]:
+                conn.execute("UPDATE jobs SET status = 'failed', error = 'worker lost (lease expired)', lease_owner = NULL, "
+                             "finished_at = ?, updated_at = ? WHERE id = ?", (now, now, row["id"]))
+            else:
+                conn.execute("UPDATE jobs SET status = 'queued', run_after = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                             (now, now, row["id"]))
+            self.counters["recovered"] += 1
+        row = conn.execute("SELECT id, kind, payload, attempts, max_attempts FROM jobs WHERE status = 'queued' AND run_after <= ? "
+                           "ORDER BY priority DESC, created_at LIMIT 1", (now,)).fetchone()
+        job = None
+        if row is not None:
+            job = {**dict(row), "attempts": row["attempts"] + 1}
+            conn.execute("UPDATE jobs SET status = 'running', attempts = ?, lease_owner = ?, lease_expires = ?, "
+                         "started_at = ?, updated_at = ? WHERE id = ?",
+                         (job["attempts"], self.owner, now + self.lease, now, now, row["id"]))
+        conn.commit()
+        return job
+    async def _update_owned(self, job_id: str, sql: str, params: tuple) -> bool:
+        """UPDATE guarded on this worker still holding the lease"""
+        def op(conn):
+            changed = conn.execute(f"UPDATE jobs SET {sql}, lease_owner = NULL, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                                   params + (time.time(), job_id, self.owner)).rowcount
+            conn.commit()
+            return changed > 0
+        return await self.db.run(op)
+    async def _renew(self, job_id: str, task: asyncio.Task, progress: Dict):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            snapshot = json.dumps(progress, ensure_ascii=False, default=str)
+            def op(conn):
+                now = time.time()
+                changed = conn.execute("UPDATE jobs SET lease_expires = ?, progress = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                                       (now + self.lease, snapshot, now, job_id, self.owner)).rowcount
+                conn.commit()
+                row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                return changed > 0 and not (row and row["cancel_requested"])
+            try:
+                keep_going = await self.db.run(op)
+            except Exception as e:
+                logger.warning(f"Job {job_id} heartbeat failed: {e}")
+                continue
+            if not keep_going:  # cancelled, or the lease was lost to another worker
+                task.cancel()
+                return
+    async def _execute(self, job: Dict):
+        job_id = job["id"]
+        handler = self.handlers.get(job["kind"])
+        progress: Dict = {}
+        task = asyncio.create_task(handler(json.loads(job["payload"]), progress)) if handler else None
+        if task is None:
+            await self._update_owned(job_id, "status = 'failed', error = ?, finished_at = ?", (f"No handler for {job['kind']}", time.time()))
+            return
+        self._running[job_id] = task
+        renewer = asyncio.create_task(self._renew(job_id, task, progress))
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            # shutdown past the grace period - hand the job back without charging an attempt
+            task.cancel()
+            await asyncio.shield(self._update_owned(job_id, "status = 'queued', attempts = attempts - 1, run_after = ?", (time.time(),)))
+            self.counters["requeued_on_shutdown"] += 1
+            raise
+        finally:
+            renewer.cancel()
+            self._running.pop(job_id, None)
+        now = time.time()
+        progress_json = json.dumps(progress, ensure_ascii=False, default=str)
+        if task.cancelled():
+            if await self._update_owned(job_id, "status = 'cancelled', progress = ?, finished_at = ?", (progress_json, now)):
+                self.counters["cancelled"] += 1
+            return
+        error = task.exception()
+        if error is None:
+            await self._update_owned(job_id, "status = 'succeeded', result = ?, progress = ?, error = NULL, finished_at = ?",
+                                     (json.dumps(task.result(), ensure_ascii=False, default=str), progress_json, now))
+            self.counters["succeeded"] += 1
+            return
+        message = error.detail if isinstance(error, HTTPException) else f"{error.__class__.__name__}: {error}"
+        permanent = isinstance(error, HTTPException) and error.status_code < 500
+        if not permanent and job["attempts"] < job["max_attempts"]:
+            delay = JOB_RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.0)
+            await self._update_owned(job_id, "status = 'queued', run_after = ?, error = ?, progress = ?", (now + delay, message, progress_json))
+            self.counters["retried"] += 1
+            logger.warning(f"🧵 Job {job_id} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {message}")
+        else:
+            await self._update_owned(job_id, "status = 'failed', error = ?, progress = ?, finished_at = ?", (message, progress_json, now))
+            self.counters["failed"] += 1
+            logger.error(f"🧵 Job {job_id} failed after {job['attempts']} attempt(s): {message}")
+    async def _work(self):
+        while not self._stopping:
+            try:
+                job = await self.db.run(self._claim)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                job = None
+            if job is not None:
+                await self._execute(job)
+                continue
+            # idle - woken by a local enqueue, or poll for jobs enqueued by other workers and due retries
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    async def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        cutoff = time.time() - JOB_RETENTION_HOURS * 3600
+        await self.db.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?", (cutoff,))
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"✅ Job workers started ({self.workers}, lease={self.lease}s)")
+    async def stop(self, grace: float = JOB_SHUTDOWN_GRACE):
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=grace)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("🛑 Job workers stopped")
+    async def get(self, job_id: str) -> Optional[Dict]:
+        row = await self.db.fetchone("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self.view(row) if row else None
+    async def recent(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        sql, params = "SELECT * FROM jobs", ()
+        if status:
+            sql, params = sql + " WHERE status = ?", (status,)
+        rows = await self.db.fetchall(sql + " ORDER BY created_at DESC LIMIT ?", params + (limit,))
+        return [self.view(row, include_result=False) for row in rows]
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """Queued jobs are cancelled outright; running ones stop at their next heartbeat. Returns the new status"""
+        def op(conn):
+            now = time.time()
+            if conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                            (now, now, job_id)).rowcount:
+                conn.commit()
+                return "cancelled"
+            if conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = 'running'",
+                            (now, job_id)).rowcount:
+                conn.commit()
+                return "cancelling"
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row["status"] if row else None
+        return await self.db.run(op)
+    @staticmethod
+    def view(row: Dict, include_result: bool = True) -> Dict:
+        def stamp(value):
+            return datetime.fromtimestamp(value).isoformat() if value else None
+        job = {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "error": row["error"],
+            "created_at": stamp(row["created_at"]),
+            "started_at": stamp(row["started_at"]),
+            "finished_at": stamp(row["finished_at"]),
+        }
+        if row["status"] == "queued" and row["run_after"] and row["run_after"] > time.time():
+            job["retry_at"] = stamp(row["run_after"])
+        if include_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+    def stats(self) -> Dict:
+        return {**self.counters, "workers": len(self._tasks), "running": len(self._running), "owner": self.owner}
+job_queue = JobQueue(db)
+def _job_result(result: Dict) -> Dict:
+    """Feature results report upstream failure in-band; raise so the queue retries instead of storing demo text"""
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    if result.get("fallback"):
+        raise RuntimeError("Upstream model unavailable - demo fallback served")
+    return result
+async def _upload_job(payload: Dict, progress: Dict) -> Dict:
+    return _job_result(await _process_saved_upload(payload["saved"], payload["feature"], payload.get("session_id"), progress))
+async def _feature_job(payload: Dict, progress: Dict) -> Dict:
+    return _job_result(await silicon_baap_ai.process_baap_feature(
+        payload["feature"], payload["message"], payload.get("model") or "auto",
+        payload.get("session_id"), analyze=payload.get("analyze", True), progress=progress))
+job_queue.register("upload", _upload_job)
+job_queue.register("feature", _feature_job)
+def job_accepted(job: Dict, **extra) -> JSONResponse:
+    return JSONResponse({**job, **extra}, status_code=202, headers={"Location": job["status_url"]})
 # ====================== FASTAPI LIFESPAN 🌟 ======================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 SILICON VALLEY KA BAAP AI Starting... 💪")
+    await asyncio.to_thread(init_database)  # pending migrations run here rather than on the first request
+    await asyncio.to_thread(lambda: token_estimator.encoding)  # a first tiktoken load may download its vocab
+    await http_pool.start()
+    if WRITE_BEHIND_ENABLED:
+        await write_behind.start()
+    if shared_state is not None:
+        await shared_state.purge()
+    await job_queue.start()
     yield
     logger.info("🛑 SILICON VALLEY KA BAAP AI Shutting Down...")
-app = FastAPI(
-    title="🚀 SILICON VALLEY KA BAAP AI",
-    description="💪 Professional AI Assistant • All Models Ka Baap • GROQ Powered • Created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)",
-    version="300.0.0-ULTIMATE-BAAP",
-    lifespan=lifespan
-)
-# FIXED: Mount static properly - serves index.html via templates, static for css/js
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+    await job_queue.stop()
+    await write_behind.stop()
+    await http_pool.close()
+    db.close()
+    close_analysis_executor()
+    document_extractor.close()
+    if shared_state is not None:
+        shared_state.close()
+router = APIRouter()
 class ChatRequest(BaseModel):
     feature: str
     message: str
-    model: Optional[str] = "llama-3.3-70b-versatile"
+    model: Optional[str] = "auto"  # "auto" lets the model router pick
     session_id: Optional[str] = None
-@app.post("/api/chat")
+    analyze: bool = True  # False skips language/domain detection when the client ignores those fields
+    background: Optional[bool] = None  # None: queue a job only for JOB_BACKGROUND_FEATURES
+    priority: int = 0
+@router.post("/api/chat")
 async def chat_endpoint(payload: ChatRequest):
+    if payload.background or (payload.background is None and payload.feature in JOB_BACKGROUND_FEATURES):
+        job = await job_queue.enqueue("feature", {"feature": payload.feature, "message": payload.message, "model": payload.model,
+                                                  "session_id": payload.session_id, "analyze": payload.analyze}, payload.priority)
+        return job_accepted(job, feature=payload.feature)
     try:
         result = await silicon_baap_ai.process_baap_feature(
             payload.feature,
             payload.message,
             payload.model,
-            payload.session_id
+            payload.session_id,
+            analyze=payload.analyze
         )
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Chat endpoint error: {e}")
         return {"error": f"❌ Chat Error: {str(e)}", "status": "error"}
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...), feature: str = Form(...), session_id: Optional[str] = Form(None)):
+@router.post("/api/chat/stream")
+async def chat_stream_endpoint(payload: ChatRequest, format: str = "sse"):
+    """Stream tokens as Server-Sent Events (default) or newline-delimited JSON (?format=ndjson)"""
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    if payload.model not in SILICON_BAAP_MODELS and payload.model not in (None, "auto"):
+        raise HTTPException(status_code=400, detail=f"Unknown model: {payload.model}")
+    async def event_stream():
+        try:
+            async for event in silicon_baap_ai.stream_baap_feature(payload.feature, payload.message, payload.model, payload.session_id, analyze=payload.analyze):
+                name = event.pop("event")
+                if format == "ndjson":
+                    yield json.dumps({"type": name, **event}, ensure_ascii=False) + "\n"
+                else:
+                    yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            error = {"error": f"❌ Chat Error: {str(e)}", "status": "error"}
+            if format == "ndjson":
+                yield json.dumps({"type": "error", **error}, ensure_ascii=False) + "\n"
+            else:
+                yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(event_stream(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+async def _enqueue_upload(saved: Dict, feature: str, session_id: Optional[str], priority: int) -> JSONResponse:
+    upload_board.finish(saved["upload_id"])  # receiving is done; processing progress lives on the job
+    job = await job_queue.enqueue("upload", {"saved": saved, "feature": feature, "session_id": session_id}, priority)
+    return job_accepted(job, feature=feature, filename=saved["filename"],
+                        upload={k: saved[k] for k in ("upload_id", "sha256", "size", "deduplicated")})
+@router.post("/api/upload")
+async def upload_file(file: UploadFile = File(...), feature: str = Form(...), session_id: Optional[str] = Form(None),
+                      upload_id: Optional[str] = Form(None), wait: bool = Form(not UPLOAD_ASYNC), priority: int = Form(0)):
+    """Stores the file, then answers 202 with a job_id (poll /api/jobs/{id}) - or the result itself with wait=true"""
     try:
-        content = await file.read()
-        file_path = f"uploads/{uuid.uuid4()}_{file.filename}"
-        Path("uploads").mkdir(parents=True, exist_ok=True)
-        with open(file_path, "wb") as f:
-            f.write(content)
-        file_type = file.filename.split('.')[-1].lower()
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("INSERT INTO uploaded_files (filename, file_type, content) VALUES (?, ?, ?)",
-                 (file.filename, file_type, f"File uploaded: {file.filename}"))
-        conn.commit()
-        conn.close()
-        input_data = f"file:{file_path}"
-        result = await silicon_baap_ai.process_baap_feature(feature, input_data, "llama-3.3-70b-versatile", session_id)
-        return {
-            "feature": feature,
-            "filename": file.filename,
-            "file_type": file_type,
-            **result
-        }
+        saved = await save_upload_stream(_iter_upload_file(file), file.filename, upload_id, file.size)
+        if not wait:
+            return await _enqueue_upload(saved, feature, session_id, priority)
+        return await _process_saved_upload(saved, feature, session_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return {"error": f"File upload error: {str(e)}", "status": "error"}
-@app.get("/api/status")
+@router.post("/api/upload/stream")
+async def upload_stream(request: Request, filename: str, feature: str, session_id: Optional[str] = None,
+                        upload_id: Optional[str] = None, wait: bool = not UPLOAD_ASYNC, priority: int = 0):
+    """Raw-body upload (e.g. `curl --data-binary @big.pdf "/api/upload/stream?filename=big.pdf&feature=file_reader"`).
+    The body is consumed straight off the socket, so /api/upload/progress/{upload_id} reflects network progress."""
+    content_length = request.headers.get("content-length")
+    try:
+        saved = await save_upload_stream(request.stream(), filename, upload_id,
+                                         int(content_length) if content_length and content_length.isdigit() else None)
+        if not wait:
+            return await _enqueue_upload(saved, feature, session_id, priority)
+        return await _process_saved_upload(saved, feature, session_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Streaming upload error: {e}")
+        return {"error": f"File upload error: {str(e)}", "status": "error"}
+@router.post("/api/batch")
+async def batch_endpoint(payload: BatchRequest):
+    """Run many completions in one request; results stream back as NDJSON as each item finishes"""
+    return batch_response(payload.items, payload.batch_id, payload.concurrency, payload.session_id, payload.replay)
+@router.post("/api/batch/upload")
+async def batch_upload(file: UploadFile = File(...), batch_id: Optional[str] = Form(None), concurrency: Optional[int] = Form(None),
+                       session_id: Optional[str] = Form(None), replay: bool = Form(False)):
+    """Same as /api/batch with the items given as an uploaded JSONL file"""
+    data = await file.read(BATCH_MAX_BYTES + 1)
+    if len(data) > BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch file exceeds {BATCH_MAX_BYTES} bytes")
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Batch file must be UTF-8 JSONL")
+    return batch_response(parse_batch_jsonl(text), batch_id, concurrency, session_id, replay)
+@router.get("/api/batch/{batch_id}")
+async def batch_results(batch_id: str):
+    """Stored results of a batch as NDJSON, in completion order"""
+    page_size = 500
+    async def page(after: int) -> List[Dict]:
+        return await db.fetchall("SELECT rowid, item_id, status, result, completed_at FROM batch_results WHERE batch_id = ? AND rowid > ? "
+                                 "ORDER BY rowid LIMIT ?", (batch_id, after, page_size))
+    first = await page(0)
+    if not first:
+        raise HTTPException(status_code=404, detail="Unknown batch_id")
+    async def export():
+        rows = first
+        while rows:
+            for row in rows:
+                yield json.dumps({"id": row["item_id"], "status": row["status"], "completed_at": row["completed_at"],
+                                  "result": json.loads(row["result"])}, ensure_ascii=False) + "\n"
+            rows = await page(rows[-1]["rowid"]) if len(rows) == page_size else []
+    return StreamingResponse(export(), media_type="application/x-ndjson")
+@router.delete("/api/batch/{batch_id}")
+async def delete_batch(batch_id: str):
+    def op(conn):
+        deleted = conn.execute("DELETE FROM batch_results WHERE batch_id = ?", (batch_id,)).rowcount
+        conn.commit()
+        return deleted
+    return {"batch_id": batch_id, "deleted": await db.run(op)}
+@router.get("/api/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    if status and status not in ("queued", "running") + JobQueue.TERMINAL:
+        raise HTTPException(status_code=400, detail=f"Unknown status: {status}")
+    return {"jobs": await job_queue.recent(status, max(1, min(limit, 500)))}
+@router.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    return job
+@router.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, interval: float = 0.5):
+    """Server-Sent Events: `status` and `progress` on change, then `done` with the finished job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    interval = max(0.1, interval)
+    async def event_stream():
+        current, last_status, last_progress = job, None, None
+        while True:
+            status_key = (current["status"], current["attempts"])
+            if status_key != last_status:
+                last_status = status_key
+                yield f"event: status\ndata: {json.dumps({k: current[k] for k in ('job_id', 'status', 'attempts', 'error')}, ensure_ascii=False)}\n\n"
+            if current["progress"] != last_progress:
+                last_progress = current["progress"]
+                yield f"event: progress\ndata: {json.dumps(last_progress, ensure_ascii=False)}\n\n"
+            if current["status"] in JobQueue.TERMINAL:
+                yield f"event: done\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+                return
+            await asyncio.sleep(interval)
+            current = await job_queue.get(job_id) or current
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+@router.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    status = await job_queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    return {"job_id": job_id, "status": status}
+@router.get("/api/upload/progress/{upload_id}")
+async def upload_progress_status(upload_id: str):
+    progress = await upload_board.get(upload_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown upload_id")
+    return progress
+@router.get("/api/status")
 async def status():
     return {
         "status": "🟢 ONLINE",
@@ -1216,40 +3821,203 @@ async def status():
         "creator": "Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)",
         "models_available": len(SILICON_BAAP_MODELS), # FIXED: No space in key
         "features_available": len(silicon_baap_ai.features),
+        "http_pool": http_pool.stats(),
+        "completion_cache": await completion_cache.stats(),
+        "database": db.stats(),
+        "write_behind": write_behind.stats(),
+        "document_extractor": document_extractor.stats(),
+        "groq_scheduler": groq_scheduler.stats(),
+        "jobs": job_queue.stats(),
+        "worker": {"pid": os.getpid(), "shared_state": shared_state.path if shared_state else None},  # other stats are per worker
+        "single_flight": completion_flights.stats(),
+        "model_router": model_router.stats(),
+        "hedging": hedger.stats(),
         "timestamp": datetime.now().isoformat()
     }
-@app.get("/api/conversations/{session_id}")
-async def get_conversation(session_id: str):
+CONVERSATION_FIELDS = ("id", "session_id", "feature", "user_input", "ai_response", "model_used", "timestamp")
+def _encode_cursor(row: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row["timestamp"], row["id"]]).encode()).decode().rstrip("=")
+def _decode_cursor(cursor: str) -> tuple:
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT * FROM conversations WHERE session_id = ? ORDER BY timestamp", (session_id,))
-        conversations = c.fetchall()
-        conn.close()
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(timestamp), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+def _conversation_columns(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(CONVERSATION_FIELDS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in CONVERSATION_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # id + timestamp are always selected because the cursor is built from them
+    return [f for f in CONVERSATION_FIELDS if f in requested or f in ("id", "timestamp")]
+async def _conversation_page(session_id: str, columns: List[str], limit: int, after: Optional[tuple]) -> List[Dict]:
+    sql = f"SELECT {', '.join(columns)} FROM conversations WHERE session_id = ?"
+    params: tuple = (session_id,)
+    if after:
+        sql += " AND (timestamp, id) > (?, ?)"
+        params += after
+    sql += " ORDER BY timestamp, id LIMIT ?"
+    return await db.fetchall(sql, params + (limit,))
+def attachment_header(filename: str) -> str:
+    """Content-Disposition safe for any filename: an ASCII fallback plus the RFC 5987 UTF-8 form"""
+    fallback = re.sub(r'[^A-Za-z0-9._-]', "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+@router.get("/api/conversations/{session_id}")
+async def get_conversation(session_id: str, limit: int = HISTORY_PAGE_SIZE, cursor: Optional[str] = None,
+                           fields: Optional[str] = None, format: str = "json"):
+    """Keyset-paginated history. `fields` projects columns (e.g. fields=feature,user_input),
+    `cursor` continues from next_cursor, and format=ndjson streams the whole session as an export."""
+    columns = _conversation_columns(fields)
+    after = _decode_cursor(cursor) if cursor else None
+    if format == "ndjson":
+        async def export():
+            position = after
+            while True:
+                page = await _conversation_page(session_id, columns, HISTORY_MAX_PAGE_SIZE, position)
+                for row in page:
+                    yield json.dumps(row, ensure_ascii=False) + "\n"
+                if len(page) < HISTORY_MAX_PAGE_SIZE:
+                    break
+                position = (page[-1]["timestamp"], page[-1]["id"])
+        return StreamingResponse(export(), media_type="application/x-ndjson",
+                                 headers={"Content-Disposition": attachment_header(f"conversations_{session_id}.ndjson")})
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    try:
+        # Fetch one extra row to know whether another page exists
+        conversations = await _conversation_page(session_id, columns, limit + 1, after)
+        has_more = len(conversations) > limit
+        conversations = conversations[:limit]
         return {
             "session_id": session_id,
-            "conversations": [dict(conv) for conv in conversations],
-            "count": len(conversations)
+            "conversations": conversations,
+            "count": len(conversations),
+            "has_more": has_more,
+            "next_cursor": _encode_cursor(conversations[-1]) if has_more else None
         }
     except Exception as e:
         logger.error(f"Conversation fetch error: {e}")
         return {"error": str(e)}
-@app.get("/", response_class=HTMLResponse)
+USAGE_GROUPS = {
+    "feature": ("feature",),
+    "model": ("model_used",),
+    "feature_model": ("feature", "model_used"),
+    "session": ("session_id",),
+    "day": ("date(timestamp)",),
+}
+@router.get("/api/usage")
+async def usage_summary(group_by: str = "feature_model", since: Optional[str] = None, session_id: Optional[str] = None, limit: int = 100):
+    """Token usage aggregated from usage_stats (?group_by=feature|model|feature_model|session|day&since=2025-01-01)"""
+    if group_by not in USAGE_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(USAGE_GROUPS)}")
+    columns = USAGE_GROUPS[group_by]
+    where, params = [], []
+    if since:
+        where.append("timestamp >= ?")
+        params.append(since)
+    if session_id:
+        where.append("session_id = ?")
+        params.append(session_id)
+    select = ", ".join(f"{column} AS {column.replace('date(timestamp)', 'day')}" for column in columns)
+    sql = (f"SELECT {select}, COUNT(*) AS requests, SUM(tokens_used) AS total_tokens, SUM(prompt_tokens) AS prompt_tokens, "
+           f"SUM(completion_tokens) AS completion_tokens FROM usage_stats "
+           f"{'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY {', '.join(columns)} ORDER BY total_tokens DESC LIMIT ?")
+    try:
+        rows = await db.fetchall(sql, (*params, max(1, min(limit, 1000))))
+        return {"group_by": group_by, "since": since, "rows": rows,
+                "total_tokens": sum(row["total_tokens"] or 0 for row in rows), "tokenizer": token_estimator.backend}
+    except Exception as e:
+        logger.error(f"Usage query error: {e}")
+        return {"error": str(e), "status": "error"}
+@router.get("/", response_class=HTMLResponse)
 async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
-@app.get("/health")
+    return request.app.state.assets.serve_landing(request)
+@router.get("/assets/{name}")
+async def fingerprinted_asset(request: Request, name: str):
+    return request.app.state.assets.serve(request, name)
+@router.get("/health")
 async def health():
     return {"status": "💪 HEALTHY", "service": "Silicon Valley Ka Baap AI • Created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)"}
-if __name__ == "__main__":
+# ====================== APP FACTORY 🏭 ======================
+def create_app() -> FastAPI:
+    """Build the ASGI app (`uvicorn main:create_app --factory`, or `main:app`, which calls this lazily).
+    Importing the module has no side effects; UI assets are synced here per UI_ASSETS_ON_STARTUP."""
+    if UI_ASSETS_ON_STARTUP == "sync":
+        build_ui_assets()
+    application = FastAPI(
+        title="🚀 SILICON VALLEY KA BAAP AI",
+        description="💪 Professional AI Assistant • All Models Ka Baap • GROQ Powered • Created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)",
+        version="300.0.0-ULTIMATE-BAAP",
+        lifespan=lifespan
+    )
+    # /static stays for videos and unversioned links; the page itself references /assets/ fingerprints
+    application.mount("/static", StaticFiles(directory="static"), name="static")
+    application.state.assets = AssetPipeline().load()
+    application.include_router(router)
+    return application
+_app: Optional[FastAPI] = None
+def __getattr__(name: str):
+    # `main.app` stays available for `uvicorn main:app` and existing imports, built on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+# ====================== CLI 🖥️ ======================
+def build_cli() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="Silicon Valley Ka Baap AI server")
+    commands = parser.add_subparsers(dest="command")
+    serve = commands.add_parser("serve", help="run the API server (default)")
+    serve.add_argument("--host", default=HOST)
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                       help="worker processes; more than one shares rate limits and cache via SHARED_STATE_PATH")
+    serve.add_argument("--loop", choices=("auto", "asyncio", "uvloop"), default="auto", help="auto picks uvloop when installed")
+    serve.add_argument("--http", choices=("auto", "h11", "httptools"), default="auto", help="auto picks httptools when installed")
+    serve.add_argument("--graceful-timeout", type=float, default=30.0, help="seconds to drain in-flight requests on shutdown")
+    serve.add_argument("--keep-alive", type=int, default=5, help="idle keep-alive timeout in seconds")
+    build = commands.add_parser("build-assets", help="write the UI files whose content changed")
+    build.add_argument("--force", action="store_true", help="rewrite every file")
+    return parser
+def serve_command(args: argparse.Namespace):
+    import uvicorn
+    if args.workers > 1:
+        # Workers are fresh interpreters configured from the environment
+        os.environ.setdefault("SHARED_STATE_PATH", "silicon_baap_shared.db")
+    # Assets and migrations run once here rather than racing in every worker
+    if UI_ASSETS_ON_STARTUP == "sync":
+        build_ui_assets()
+    os.environ["UI_ASSETS_ON_STARTUP"] = "off"
+    init_database()
+    db.close()
     logger.info("🚀 STARTING SILICON VALLEY KA BAAP AI - 300+ FEATURES EDITION...")
-    logger.info(f"🌐 Server will run at: http://{HOST}:{PORT}")
+    logger.info(f"🌐 Server will run at: http://{args.host}:{args.port} with {args.workers} worker(s)")
     logger.info("💡 Demo Mode Active - No API Key Needed! All curl tests will work with feature-specific responses.")
     logger.info("🎯 300+ AI Features Ready to Use! Enhanced error handling for Groq 400/401.")
     logger.info("👨‍💻 Created by Syed Kawish Ali from Karachi, Pakistan (kawish.alisas@gmail.com)")
     uvicorn.run(
-        app,
-        host=HOST,
-        port=PORT,
-        reload=False,
+        "main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
         log_level="info"
-    )
\ No newline at end of file
+    )
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv = ["serve", *argv]  # `python main.py [--workers N ...]` keeps working
+    args = build_cli().parse_args(argv)
+    if args.command == "build-assets":
+        for path, written in build_ui_assets(force=args.force).items():
+            print(f"{'built    ' if written else 'unchanged'} {path}")
+    else:
+        serve_command(args)
@@ -2,7 +2,7 @@
     class SiliconBaapAI {
         constructor() {
             this.currentFeature = 'chat';
-            this.currentModel = 'llama-3.3-70b-versatile';
+            this.currentModel = 'auto';
             this.isProcessing = false;
             this.sessionId = this.generateSessionId();
             this.conversationHistory = [];
@@ -38,20 +38,34 @@
             input.value = ''; input.style.height = 'auto';
             this.showTypingIndicator(); this.isProcessing = true; this.updateSendButton();
             try {
-                const response = await this.apiCall('/api/chat', {
-                    feature: this.currentFeature,
-                    message: message,
-                    model: this.currentModel,
-                    session_id: this.sessionId
+                const response = await fetch('/api/chat/stream', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                    body: JSON.stringify({ feature: this.currentFeature, message: message, model: this.currentModel, session_id: this.sessionId })
                 });
-                if (response && response.status === 'success') {
-                    this.hideTypingIndicator();
-                    this.addMessageToUI('ai', response.response, this.currentFeature, response.model, response.detected_language, response.detected_domain);
-                    this.saveToHistory('user', message, this.currentFeature);
-                    this.saveToHistory('ai', response.response, this.currentFeature, response.model);
-                } else {
-                    throw new Error(response?.error || 'Unknown error occurred');
-                }
+                if (!response.ok || !response.body) { throw new Error(await response.text()); }
+                let messageDiv = null, fullText = '', result = null;
+                await this.readEventStream(response, (event, data) => {
+                    if (event === 'meta') {
+                        this.hideTypingIndicator();
+                        messageDiv = this.addMessageToUI('ai', '', this.currentFeature, data.model);
+                    } else if (event === 'token') {
+                        fullText += data.delta;
+                        messageDiv.querySelector('.message-content').textContent = fullText;
+                        const messagesContainer = document.getElementById('messagesContainer');
+                        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                    } else if (event === 'done') {
+                        result = data;
+                    } else if (event === 'error') {
+                        throw new Error(data.error || 'Unknown error occurred');
+                    }
+                });
+                if (!result || result.status !== 'success') { throw new Error(result?.error || 'Stream ended unexpectedly'); }
+                const finalText = result.response || result.analysis || result.security_report || fullText;
+                messageDiv.querySelector('.message-content').textContent = finalText;
+                this.addDetectionInfo(messageDiv, result.detected_language, result.detected_domain);
+                this.saveToHistory('user', message, this.currentFeature);
+                this.saveToHistory('ai', finalText, this.currentFeature, result.model);
             } catch (error) {
                 this.hideTypingIndicator();
                 this.addMessageToUI('ai', '❌ Error: ' + error.message, this.currentFeature);
@@ -75,7 +89,9 @@
                 formData.append('session_id', this.sessionId);
                 const response = await fetch('/api/upload', { method: 'POST', body: formData });
                 if (!response.ok) { throw new Error(await response.text()); }
-                const data = await response.json(); this.hideTypingIndicator();
+                let data = await response.json();
+                if (data.job_id) { data = await this.waitForJob(data.job_id); }
+                this.hideTypingIndicator();
                 if (data.status === 'success') {
                     this.addMessageToUI('user', '📁 Uploaded file: ' + file.name, this.currentFeature);
                     this.addMessageToUI('ai', data.response, this.currentFeature, data.model, data.detected_language, data.detected_domain);
@@ -113,19 +129,43 @@
             content.textContent = message;
             messageDiv.appendChild(header);
             messageDiv.appendChild(content);
-            if (sender === 'ai' && (detectedLanguage || detectedDomain)) {
-                const detectionInfo = document.createElement('div');
-                detectionInfo.className = 'detection-info';
-                if (detectedLanguage) {
-                    detectionInfo.innerHTML += '<span class="detection-badge">' + detectedLanguage + '</span>';
-                }
-                if (detectedDomain) {
-                    detectionInfo.innerHTML += '<span class="detection-badge">' + detectedDomain + '</span>';
-                }
-                messageDiv.appendChild(detectionInfo);
-            }
+            if (sender === 'ai') { this.addDetectionInfo(messageDiv, detectedLanguage, detectedDomain); }
             messagesContainer.appendChild(messageDiv);
             messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            return messageDiv;
+        }
+        addDetectionInfo(messageDiv, detectedLanguage, detectedDomain) {
+            if (!detectedLanguage && !detectedDomain) return;
+            const detectionInfo = document.createElement('div');
+            detectionInfo.className = 'detection-info';
+            if (detectedLanguage) {
+                detectionInfo.innerHTML += '<span class="detection-badge">' + detectedLanguage + '</span>';
+            }
+            if (detectedDomain) {
+                detectionInfo.innerHTML += '<span class="detection-badge">' + detectedDomain + '</span>';
+            }
+            messageDiv.appendChild(detectionInfo);
+        }
+        async readEventStream(response, onEvent) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message', data = '';
+                    block.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) { event = line.slice(6).trim(); }
+                        else if (line.startsWith('data:')) { data += line.slice(5).trim(); }
+                    });
+                    if (data) { onEvent(event, JSON.parse(data)); }
+                }
+            }
         }
         showTypingIndicator() {
             const messagesContainer = document.getElementById('messagesContainer');
@@ -220,6 +260,7 @@
         }
         getModelName(model) {
             const models = {
+                'auto': '🧭 Auto',
                 'llama-3.3-70b-versatile': '🦙 Llama 3.3 70B',
                 'llama-3.1-8b-instant': '⚡ Llama 3.1 8B Instant',
                 'qwen/qwen3-32b': '🎯 Qwen 3 32B',
@@ -227,6 +268,16 @@
             };
             return models[model] || model;
         }
+        async waitForJob(jobId) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const response = await fetch('/api/jobs/' + jobId);
+                if (!response.ok) { throw new Error(await response.text()); }
+                const job = await response.json();
+                if (job.status === 'succeeded') { return job.result; }
+                if (job.status === 'failed' || job.status === 'cancelled') { throw new Error(job.error || 'Job ' + job.status); }
+            }
+        }
         async apiCall(endpoint, data) {
             const response = await fetch(endpoint, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(data) });
             if (!response.ok) { throw new Error(await response.text()); }